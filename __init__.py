@@ -33,8 +33,15 @@ def register():
     properties.register()
     ui.register()
 
+    bpy.app.handlers.render_complete.append(core.session.release_session)
+    bpy.app.handlers.render_cancel.append(core.session.release_session)
+
 
 def unregister():
+    bpy.app.handlers.render_complete.remove(core.session.release_session)
+    bpy.app.handlers.render_cancel.remove(core.session.release_session)
+    core.session.release_session()
+
     ui.unregister()
     properties.unregister()
     bpy.utils.unregister_module(__name__)
@@ -0,0 +1,241 @@
+"""Headless export benchmarks against a stand-in bpy.
+
+Drives export.Exporter, export_trimesh, export_material, export_light and
+export_texture on synthetic scenes. Every case runs in its own process, so
+the reported peak memory belongs to that case alone.
+
+    python benchmarks/bench_export.py [--full] [--case NAME ...]
+    python benchmarks/bench_export.py --save        # record a new baseline
+
+Baselines only compare well on the machine they were recorded on, so each
+machine keeps its own in benchmarks/baselines/<hostname>.json, or wherever
+--baseline points. Any case slower, or using more memory, than the baseline
+by more than the tolerance is reported as a regression and the exit code is
+non-zero. So is a missing baseline, or a case it has no results for, unless
+--save records them.
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import scenes
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines",
+                        "%s.json" % platform.node())
+
+# name: (function, arguments, only with --full)
+CASES = collections.OrderedDict([
+    ("trimesh_inline_1k", ("trimesh", {"triangles": 1000}, False)),
+    ("trimesh_inline_100k", ("trimesh", {"triangles": 100000}, False)),
+    ("trimesh_inline_1m", ("trimesh", {"triangles": 1000000}, False)),
+    ("trimesh_binary_1m", ("trimesh", {"triangles": 1000000, "mesh_format": 'BINARY'}, False)),
+    ("trimesh_inline_10m", ("trimesh", {"triangles": 10000000}, True)),
+    ("trimesh_binary_10m", ("trimesh", {"triangles": 10000000, "mesh_format": 'BINARY'}, True)),
+    ("scene_10_objects", ("scene", {"objects": 10, "triangles": 10000, "materials": 10,
+                                    "lights": 4, "textures": 2}, False)),
+    ("scene_1k_objects", ("scene", {"objects": 1000, "triangles": 200, "materials": 100,
+                                    "lights": 20, "textures": 10}, False)),
+    ("scene_1k_hidden", ("scene", {"objects": 1000, "triangles": 200, "materials": 100,
+                                   "lights": 20, "textures": 10, "hidden": 1000}, False)),
+    ("scene_1k_culled", ("scene", {"objects": 1000, "triangles": 200, "materials": 100,
+                                   "lights": 20, "textures": 10, "culling": True}, False)),
+    ("scene_100_lod", ("scene", {"objects": 100, "triangles": 20000, "materials": 10,
+                                 "lights": 4, "textures": 2, "lod": 0.01}, False)),
+    ("scene_10k_objects", ("scene", {"objects": 10000, "triangles": 100, "materials": 500,
+                                     "lights": 50, "textures": 50}, False)),
+    ("scene_100k_objects", ("scene", {"objects": 100000, "triangles": 100, "materials": 1000,
+                                      "lights": 100, "textures": 100}, True)),
+    ("materials_10k", ("materials", {"count": 10000, "textures": 100}, False)),
+    ("lights_10k", ("lights", {"count": 10000}, False)),
+    ("textures_1k", ("textures", {"count": 1000}, False)),
+])
+
+# Higher is better for throughput, lower for memory
+METRICS = (("tris_per_s", 1), ("items_per_s", 1), ("mb_per_s", 1), ("peak_mb", -1))
+
+
+def open_exporter(export, scene, directory):
+    # Extracted images go to the texture cache inside the scratch directory
+    exporter = export.Exporter(os.path.join(directory, "scene.prc"), scene, directory)
+    exporter.file = open(exporter.filename, 'w')
+    exporter.w = export.Writer(exporter.file, scene.pearray.beautiful_prc)
+    return exporter
+
+
+def case_trimesh(directory, triangles, mesh_format='INLINE'):
+    export, _ = scenes.load_addon()
+    scene = scenes.make_scene(objects=0, materials=0, lights=0, mesh_format=mesh_format,
+                              directory=directory)
+    mesh = scenes.Mesh(*scenes.grid_arrays(triangles))
+
+    exporter = open_exporter(export, scene, directory)
+    start = time.perf_counter()
+    export.mesh.export_trimesh(exporter, None, "mesh", mesh)
+    exporter.close()
+    elapsed = time.perf_counter() - start
+
+    return elapsed, exporter.bytes_written(), 2 * len(mesh.tessfaces), 1
+
+
+def case_scene(directory, objects, triangles, materials, lights, textures, hidden=0,
+               culling=False, lod=0):
+    export, _ = scenes.load_addon()
+    scene = scenes.make_scene(objects, triangles, materials, lights, textures,
+                              directory=directory, hidden=hidden, culling=culling, lod=lod)
+
+    exporter = export.Exporter(os.path.join(directory, "scene.prc"), scene, directory)
+    start = time.perf_counter()
+    exporter.write_scene(scenes.fake_pearray())
+    elapsed = time.perf_counter() - start
+
+    return elapsed, exporter.bytes_written(), objects * triangles, len(scene.objects)
+
+
+def case_items(directory, func, items):
+    export, _ = scenes.load_addon()
+    scene = scenes.make_scene(objects=0, materials=0, lights=0, directory=directory)
+
+    exporter = open_exporter(export, scene, directory)
+    start = time.perf_counter()
+    for item in items:
+        func(exporter, item)
+    exporter.close()
+    elapsed = time.perf_counter() - start
+
+    return elapsed, exporter.bytes_written(), 0, len(items)
+
+
+def case_materials(directory, count, textures):
+    export, properties = scenes.load_addon()
+    texture_list = scenes.make_textures(textures, directory)
+    return case_items(directory, export.material.export_material,
+                      scenes.make_materials(count, texture_list, properties))
+
+
+def case_lights(directory, count):
+    export, properties = scenes.load_addon()
+    return case_items(directory, export.light.export_light,
+                      scenes.make_lights(count, properties))
+
+
+def case_textures(directory, count):
+    export, _ = scenes.load_addon()
+    return case_items(directory, export.texture.export_texture,
+                      scenes.make_textures(count, directory))
+
+
+def run_case(name):
+    func, kwargs, _ = CASES[name]
+    directory = tempfile.mkdtemp(prefix="pearray_bench_")
+    try:
+        elapsed, written, triangles, items = globals()["case_" + func](directory, **kwargs)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    export, _ = scenes.load_addon()
+    elapsed = max(elapsed, 1e-9)
+    return {
+        "seconds": elapsed,
+        "tris_per_s": triangles / elapsed,
+        "items_per_s": items / elapsed,
+        "mb_per_s": written / elapsed / 1e6,
+        "peak_mb": export.profiler.peak_rss() / 1e6,
+    }
+
+
+def spawn_case(name):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--run-case", name])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            regressions.append("%s: not in the baseline, run with --save to record it" % name)
+            continue
+
+        for metric, direction in METRICS:
+            old = reference.get(metric, 0)
+            new = result[metric]
+            if not old:
+                continue
+
+            change = (new - old) / old * direction
+            if change < -tolerance:
+                regressions.append("%s: %s %.4g -> %.4g (%+.0f%%)" %
+                                   (name, metric, old, new, 100 * change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full", action="store_true",
+                        help="include the 10M triangle and 100k object cases")
+    parser.add_argument("--case", action="append", choices=list(CASES),
+                        help="only run the given cases")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="results to compare against, default baselines/<hostname>.json")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative regression, default 0.2")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case)))
+        return
+
+    names = args.case or [name for name, case in CASES.items() if args.full or not case[2]]
+
+    print("%-20s %9s %12s %12s %9s %9s" %
+          ("case", "seconds", "triangles/s", "items/s", "MB/s", "peak MB"))
+    results = collections.OrderedDict()
+    for name in names:
+        result = spawn_case(name)
+        results[name] = result
+        print("%-20s %9.3f %12.0f %12.0f %9.1f %9.1f" %
+              (name, result["seconds"], result["tris_per_s"], result["items_per_s"],
+               result["mb_per_s"], result["peak_mb"]))
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        directory = os.path.dirname(args.baseline)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=1, sort_keys=True)
+        print("baseline written to %s" % args.baseline)
+        return
+
+    if not os.path.exists(args.baseline):
+        sys.exit("no baseline at %s, run with --save to record one" % args.baseline)
+
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+
+    if regressions:
+        print("\nREGRESSIONS against %s:" % args.baseline)
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+
+    print("\nno regressions against %s" % args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Time per image refresh during a progressive render.
+
+A fake render engine stands in for Blender, its rect assignment converts
+the data to a Python list like bpy does. Each refresh a part of the tiles
+change. Compares the previous full frame update with TileFramebuffer.
+
+    python benchmarks/bench_framebuffer.py [width height [tile]]
+"""
+import sys
+import time
+
+import numpy as np
+
+from common import load_module
+
+framebuffer = load_module("pearray_framebuffer", "core", "framebuffer.py")
+
+REFRESHES = 8
+CHANGED_FRACTION = 0.125
+
+
+class FakePass:
+    @property
+    def rect(self):
+        return self._rect
+
+    @rect.setter
+    def rect(self, value):
+        self._rect = np.asarray(value).tolist()
+
+
+class FakeLayer:
+    def __init__(self):
+        self.passes = {"Combined": FakePass()}
+
+
+class FakeResult:
+    def __init__(self):
+        self.layers = [FakeLayer()]
+
+
+class FakeEngine:
+    def begin_result(self, x, y, w, h):
+        return FakeResult()
+
+    def update_result(self, result):
+        pass
+
+    def end_result(self, result):
+        pass
+
+
+def progressive_frames(width, height, tile):
+    # Every refresh touches a random subset of the tiles
+    rng = np.random.RandomState(7)
+    arr = np.zeros((height, width, 4), dtype=np.float32)
+    rows = range(0, height, tile)
+    cols = range(0, width, tile)
+    tiles = [(r, c) for r in rows for c in cols]
+    for _ in range(REFRESHES):
+        for i in rng.choice(len(tiles), max(1, int(len(tiles) * CHANGED_FRACTION)), replace=False):
+            r, c = tiles[i]
+            arr[r:r + tile, c:c + tile] += rng.uniform(0, 1)
+        yield arr
+
+
+def run_legacy(width, height, tile):
+    engine = FakeEngine()
+    result = engine.begin_result(0, 0, width, height)
+    layer = result.layers[0]
+    times = []
+    for arr in progressive_frames(width, height, tile):
+        start = time.perf_counter()
+        data = np.reshape(np.flip(arr, 0), (width * height, 4), 'C')
+        layer.passes["Combined"].rect = data
+        engine.update_result(result)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_tiled(width, height, tile):
+    fb = framebuffer.TileFramebuffer(FakeEngine(), width, height, tile, tile)
+    fb.update(np.zeros((height, width, 4), dtype=np.float32))
+    fb.refresh_times = []
+    for arr in progressive_frames(width, height, tile):
+        fb.update(arr)
+    fb.finish()
+    return fb.refresh_times
+
+
+def main():
+    width, height = 1920, 1080
+    tile = 64
+    if len(sys.argv) > 2:
+        width, height = int(sys.argv[1]), int(sys.argv[2])
+    if len(sys.argv) > 3:
+        tile = int(sys.argv[3])
+
+    print("Framebuffer refresh: %ix%i, %ipx tiles, %i%% of tiles changed per refresh" %
+          (width, height, tile, CHANGED_FRACTION * 100))
+    for name, func in (("legacy", run_legacy), ("tiled", run_tiled)):
+        times = func(width, height, tile)
+        print("  %-6s %8.1f ms mean %8.1f ms max" %
+              (name, 1000 * sum(times) / len(times), 1000 * max(times)))
+
+
+if __name__ == "__main__":
+    main()
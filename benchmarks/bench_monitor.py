@@ -0,0 +1,62 @@
+"""End of render latency of the render monitor.
+
+A fake renderer finishes after a given time, with random jitter. Measures how long it takes
+until the monitor loop notices, for the previous fixed 0.25 s polling and
+for RenderMonitor.
+
+    python benchmarks/bench_monitor.py [repeats]
+"""
+import random
+import sys
+import time
+
+from common import load_module
+
+monitor = load_module("pearray_monitor", "core", "monitor.py")
+
+DURATIONS = (0.02, 0.1, 0.5, 2.0)
+
+
+class FakeRenderer:
+    def __init__(self, duration):
+        self.end = time.perf_counter() + duration
+
+    @property
+    def finished(self):
+        return time.perf_counter() >= self.end
+
+
+def wait_legacy(renderer):
+    while True:
+        time.sleep(0.25)
+        if renderer.finished:
+            return
+
+
+def wait_monitor(renderer):
+    mon = monitor.RenderMonitor(lambda: renderer.finished, lambda: False)
+    mon.every(2, lambda: None)
+    mon.every(5, lambda: None)
+    mon.run()
+
+
+def latency(wait, duration):
+    renderer = FakeRenderer(duration + random.uniform(0, 0.25))
+    wait(renderer)
+    return time.perf_counter() - renderer.end
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    random.seed(1)
+
+    print("End of render latency (mean of %i runs)" % repeats)
+    print("  %8s %12s %12s" % ("render", "legacy", "monitor"))
+    for duration in DURATIONS:
+        legacy = sum(latency(wait_legacy, duration) for _ in range(repeats)) / repeats
+        current = sum(latency(wait_monitor, duration) for _ in range(repeats)) / repeats
+        print("  %7.2fs %10.1fms %10.1fms" % (duration, legacy * 1000, current * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Unique name registration with many colliding names.
+
+Registers 100k names through NameRegistry, checks that the result matches
+the previous linear scan and compares the timings.
+
+    python benchmarks/bench_names.py [name_count]
+"""
+import sys
+import time
+
+from common import load_module
+
+names = load_module("pearray_names", "export", "names.py")
+
+
+def register_legacy(instances, name):
+    test_name = name
+    i = 1
+    while test_name in instances:
+        test_name = "%s_%i" % (name, i)
+        i = i + 1
+    instances.append(test_name)
+
+    return test_name
+
+
+def register_reference(instances, name):
+    # Same scan as register_legacy, but with a set to keep it feasible
+    test_name = name
+    i = 1
+    while test_name in instances:
+        test_name = "%s_%i" % (name, i)
+        i = i + 1
+    instances.add(test_name)
+
+    return test_name
+
+
+def requested_names(count):
+    # Many duplicates plus names that look like already suffixed ones
+    result = []
+    for i in range(count):
+        if i % 10 == 9:
+            result.append("Material_%i_%i" % (i % 2000, i % 7))
+        else:
+            result.append("Material_%i" % (i % 2000))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    requested = requested_names(count)
+
+    start = time.perf_counter()
+    registry = names.NameRegistry()
+    registered = [registry.register(n) for n in requested]
+    elapsed = time.perf_counter() - start
+
+    reference = set()
+    expected = [register_reference(reference, n) for n in requested]
+    if registered != expected:
+        index = next(i for i, (a, b) in enumerate(zip(registered, expected))
+                     if a != b)
+        sys.exit("MISMATCH at %i: %r != %r" % (index, registered[index],
+                                                 expected[index]))
+
+    legacy_count = min(count, 5000)
+    start = time.perf_counter()
+    instances = []
+    for n in requested[:legacy_count]:
+        register_legacy(instances, n)
+    legacy_elapsed = time.perf_counter() - start
+
+    print("Name registry benchmark: %i names, %i unique" %
+          (count, len(registry)))
+    print("  registry %8.3f s  %10.0f names/s" % (elapsed, count / elapsed))
+    print("  legacy   %8.3f s  %10.0f names/s (first %i names)" %
+          (legacy_elapsed, legacy_count / legacy_elapsed, legacy_count))
+    print("  names identical to the linear scan")
+
+
+if __name__ == "__main__":
+    main()
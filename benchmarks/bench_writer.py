@@ -0,0 +1,103 @@
+"""Throughput of the PRC Writer on a synthetic triangle mesh.
+
+Compares the buffered Writer.write_list path against the previous line by
+line Writer with per vertex string concatenation.
+
+    python benchmarks/bench_writer.py [vertex_count]
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import load_module
+
+writer = load_module("pearray_writer", "export", "writer.py")
+
+
+class LegacyWriter:
+    def __init__(self, file, useTabs=True):
+        self.file = file
+        self.useTabs = useTabs
+        self.currentLevel = 0
+
+    def write(self, str):
+        prefix = ""
+        if self.useTabs:
+            for i in range(self.currentLevel):
+                prefix = prefix + "\t"
+
+        self.file.write(prefix + str + "\n")
+
+    def goIn(self):
+        self.currentLevel = self.currentLevel + 1
+
+    def goOut(self):
+        self.currentLevel = self.currentLevel - 1
+
+
+def synthetic_mesh(vertex_count):
+    rng = np.random.RandomState(42)
+    points = rng.uniform(-10, 10, (vertex_count, 3)).astype(np.float32)
+    normals = rng.uniform(-1, 1, (vertex_count, 3)).astype(np.float32)
+    faces = rng.randint(0, vertex_count, (2 * vertex_count, 3))
+    return points, normals, faces
+
+
+def write_legacy(file, points, normals, faces):
+    w = LegacyWriter(file)
+    w.goIn()
+
+    line = ":type 'p'"
+    for v in points.tolist():
+        line = line + ", [%f, %f, %f]" % tuple(v)
+    w.write(line)
+
+    line = ":type 'n'"
+    for n in normals.tolist():
+        line = line + ", [%f, %f, %f]" % tuple(n)
+    w.write(line)
+
+    w.write(",".join(",".join(map(str, f)) for f in faces.tolist()))
+
+
+def write_buffered(file, points, normals, faces):
+    w = writer.Writer(file)
+    w.goIn()
+
+    w.write_list(":type 'p'", "[%f, %f, %f]", points)
+    w.write_list(":type 'n'", "[%f, %f, %f]", normals)
+    w.write_list("", "%i", faces.ravel(), ",")
+    w.flush()
+
+
+def measure(func, mesh):
+    with tempfile.TemporaryFile('w+') as file:
+        start = time.perf_counter()
+        func(file, *mesh)
+        file.flush()
+        elapsed = time.perf_counter() - start
+        size = file.tell()
+    return elapsed, size
+
+
+def main():
+    vertex_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    mesh = synthetic_mesh(vertex_count)
+
+    print("Writer benchmark: %i vertices, %i triangles" %
+          (vertex_count, len(mesh[2])))
+
+    results = {}
+    for name, func in (("legacy", write_legacy), ("buffered", write_buffered)):
+        elapsed, size = measure(func, mesh)
+        results[name] = elapsed
+        print("  %-8s %8.3f s  %8.1f MB/s  %10.0f vertices/s" %
+              (name, elapsed, size / elapsed / 1e6, vertex_count / elapsed))
+
+    print("  speedup  %8.2fx" % (results["legacy"] / results["buffered"]))
+
+
+if __name__ == "__main__":
+    main()
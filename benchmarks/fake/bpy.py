@@ -0,0 +1,70 @@
+"""Stand-in for the parts of bpy used by the exporter.
+
+Property definitions return their keyword arguments, so the benchmark scenes
+can fill the addon property groups with their real defaults.
+"""
+import os
+import sys
+
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _Collection(list):
+    is_updated = False
+
+    def remove(self, item, **kwargs):
+        pass
+
+
+app = _Namespace(version_string="2.79 (fake)")
+
+data = _Namespace(
+    filepath="",
+    objects=_Collection(),
+    meshes=_Collection(),
+    materials=_Collection(),
+    textures=_Collection(),
+    images=_Collection(),
+    lamps=_Collection(),
+    cameras=_Collection(),
+    worlds=_Collection(),
+    scenes=_Collection())
+
+path = _Namespace(
+    abspath=lambda p, **kwargs: os.path.abspath(p) if p else p,
+    resolve_ncase=lambda p: p)
+
+
+class _Type:
+    pass
+
+
+types = _Namespace(
+    RenderEngine=_Type,
+    Operator=_Type,
+    Panel=_Type,
+    Menu=_Type,
+    PropertyGroup=_Type,
+    AddonPreferences=_Type)
+
+
+def _property(kind):
+    def define(**kwargs):
+        return (kind, kwargs)
+    return define
+
+
+props = _Namespace(**dict(
+    (kind, _property(kind)) for kind in (
+        "StringProperty", "BoolProperty", "IntProperty", "IntVectorProperty",
+        "FloatProperty", "FloatVectorProperty", "EnumProperty",
+        "PointerProperty", "CollectionProperty")))
+
+context = _Namespace()
+
+# Allows "from bpy.types import ..." without bpy being a package
+sys.modules[__name__ + ".types"] = types
+sys.modules[__name__ + ".props"] = props
@@ -0,0 +1,58 @@
+"""Stand-in for the parts of mathutils used by the exporter."""
+import numpy as np
+
+
+class Vector(tuple):
+    def __new__(cls, values):
+        return tuple.__new__(cls, (float(v) for v in values))
+
+
+class Color:
+    def __init__(self, values=(0, 0, 0)):
+        self.r, self.g, self.b = (float(v) for v in values)
+
+    def __getitem__(self, index):
+        return (self.r, self.g, self.b)[index]
+
+    def __mul__(self, factor):
+        return Color((self.r * factor, self.g * factor, self.b * factor))
+
+    __rmul__ = __mul__
+
+
+class Matrix:
+    def __init__(self, rows):
+        self.array = np.array(rows, dtype=np.float64)
+
+    @staticmethod
+    def Identity(size):
+        return Matrix(np.identity(size))
+
+    @staticmethod
+    def Translation(vector):
+        matrix = np.identity(4)
+        matrix[:3, 3] = vector
+        return Matrix(matrix)
+
+    def __getitem__(self, index):
+        return Vector(self.array[index])
+
+    def __iter__(self):
+        return (Vector(row) for row in self.array)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __mul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self.array.dot(other.array))
+        return Vector(self.array.dot(np.asarray(other, dtype=np.float64)))
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(self.array))
+
+    def decompose(self):
+        # Rotation is returned as a 3x3 matrix, it rotates vectors the same way
+        basis = self.array[:3, :3]
+        scale = np.linalg.norm(basis, axis=0)
+        return Vector(self.array[:3, 3]), Matrix(basis / scale), Vector(scale)
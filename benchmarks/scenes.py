@@ -0,0 +1,306 @@
+"""Synthetic scenes for the headless export benchmarks.
+
+Everything is built from numpy arrays, so scenes with millions of triangles
+are cheap to create and the measured time is spent in the exporter.
+"""
+import collections
+import importlib
+import os
+import sys
+import types
+
+import numpy as np
+
+from common import ROOT
+
+# Scenes show the first of the 20 layers
+SCENE_LAYERS = (True,) + (False,) * 19
+OTHER_LAYERS = (False, True) + (False,) * 18
+
+FAKE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake")
+PACKAGE = "pearray"
+
+
+def load_addon():
+    # The addon imported as a package, against the stand-in bpy and mathutils
+    if PACKAGE not in sys.modules:
+        sys.path.insert(0, FAKE_DIR)
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        package.__package__ = PACKAGE
+        sys.modules[PACKAGE] = package
+
+    return (importlib.import_module(PACKAGE + ".export"),
+            importlib.import_module(PACKAGE + ".properties"))
+
+
+class Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def property_defaults(cls, **overrides):
+    import mathutils
+
+    values = Namespace()
+    for attr in dir(cls):
+        definition = getattr(cls, attr)
+        if definition is None and not attr.startswith("_"):
+            # Plain class attributes, like the grid material names
+            setattr(values, attr, None)
+            continue
+        if not (isinstance(definition, tuple) and len(definition) == 2 and
+                isinstance(definition[1], dict)):
+            continue
+
+        kind, kwargs = definition
+        value = kwargs.get("default")
+        if value is None:
+            if kind == "EnumProperty":
+                value = kwargs["items"][0][0]
+            else:
+                value = {"BoolProperty": False, "IntProperty": 0,
+                         "FloatProperty": 0.0, "StringProperty": ""}.get(kind)
+        if kind == "FloatVectorProperty" and kwargs.get("subtype") == "COLOR":
+            value = mathutils.Color(value)
+        setattr(values, attr, value)
+
+    values.__dict__.update(overrides)
+    return values
+
+
+class Enum:
+    # Every name maps to a value, only the lookup is benchmarked
+    __members__ = collections.defaultdict(int)
+
+
+def fake_pearray():
+    return Namespace(IntegratorMode=Enum, TileMode=Enum, SamplerMode=Enum,
+                     TimeMappingMode=Enum, PPMGatheringMode=Enum, DebugMode=Enum)
+
+
+class Collection:
+    def __init__(self, count, **arrays):
+        self.count = count
+        self.arrays = arrays
+
+    def __len__(self):
+        return self.count
+
+    def foreach_get(self, attr, out):
+        out[:] = self.arrays[attr].ravel()
+
+
+class Layers:
+    def __init__(self, active):
+        self.active = active
+
+    def __len__(self):
+        return 1 if self.active else 0
+
+
+def grid_arrays(triangles, seed=0):
+    # A bumpy grid of quads, every quad becomes two triangles
+    quads = max(1, triangles // 2)
+    width = int(np.ceil(np.sqrt(quads)))
+    height = int(np.ceil(quads / width))
+
+    rng = np.random.RandomState(seed)
+    x, y = np.meshgrid(np.arange(width + 1, dtype=np.float32),
+                       np.arange(height + 1, dtype=np.float32))
+    z = rng.uniform(0, 0.1, x.shape).astype(np.float32)
+    co = np.stack((x, y, z), axis=-1).reshape(-1, 3)
+    normal = np.tile(np.array([0, 0, 1], dtype=np.float32), (len(co), 1))
+
+    row = np.arange(width)
+    corners = (np.arange(height)[:, None] * (width + 1) + row[None, :]).ravel()[:quads]
+    # Starting at the second corner keeps the fourth index away from zero,
+    # like Blender does for quads
+    faces = np.stack((corners + 1, corners + width + 2, corners + width + 1, corners), axis=1)
+
+    uv = co[faces][:, :, :2] / max(width, height)
+    return co, normal, faces.astype(np.int32), uv.astype(np.float32)
+
+
+_grids = {}
+
+
+def cached_grid(triangles):
+    if triangles not in _grids:
+        _grids[triangles] = grid_arrays(triangles)
+    return _grids[triangles]
+
+
+class Mesh:
+    def __init__(self, co, normal, faces, uv, material_count=1):
+        face_count = len(faces)
+        self.vertices = Collection(len(co), co=co, normal=normal)
+        self.tessfaces = Collection(
+            face_count,
+            vertices_raw=faces,
+            normal=np.tile(np.array([0, 0, 1], dtype=np.float32), (face_count, 1)),
+            use_smooth=np.ones(face_count, dtype=bool),
+            material_index=np.arange(face_count, dtype=np.int32) % material_count)
+        self.tessface_uv_textures = Layers(Namespace(data=Collection(face_count, uv_raw=uv)))
+        self.tessface_vertex_colors = Layers(None)
+
+
+class MeshData:
+    def __init__(self, name, triangles, materials, seed):
+        self.name = name
+        self.triangles = triangles
+        self.materials = materials
+        self.shape_keys = None
+        self.seed = seed
+
+        quads = max(1, triangles // 2)
+        self.polygons = Collection(quads, loop_total=np.full(quads, 4, dtype=np.int32))
+
+    def as_pointer(self):
+        return id(self)
+
+
+class MeshObject:
+    def __init__(self, name, data, matrix_world, layers=SCENE_LAYERS):
+        self.name = name
+        self.type = 'MESH'
+        self.data = data
+        self.modifiers = []
+        self.matrix_world = matrix_world
+        self.hide_render = False
+        self.layers = layers
+
+    @property
+    def bound_box(self):
+        co = cached_grid(self.data.triangles)[0]
+        bounds = (co.min(axis=0), co.max(axis=0))
+        return [(bounds[x][0], bounds[y][1], bounds[z][2])
+                for x in (0, 1) for y in (0, 1) for z in (0, 1)]
+
+    def to_mesh(self, scene, apply_modifiers, settings, calc_tessface=True, calc_undeformed=False):
+        # A new mesh on every call like the real evaluated mesh. The offset
+        # keeps every data block unique so the content dedup does not kick in.
+        co, normal, faces, uv = cached_grid(self.data.triangles)
+        co = co + np.float32(self.data.seed * 1e-3)
+        return Mesh(co, normal, faces, uv, max(1, len(self.data.materials)))
+
+
+def make_textures(count, directory, packed_size=1 << 18):
+    # Every image is shared by two textures, every fourth one is packed
+    rng = np.random.RandomState(0)
+    textures = []
+    for i in range(count):
+        packed_file = None
+        if (i // 2) % 4 == 0:
+            packed_file = Namespace(data=rng.bytes(packed_size))
+
+        image = Namespace(name="image_%i" % (i // 2), source='FILE', packed_file=packed_file,
+                          is_dirty=False, library=None,
+                          filepath=os.path.join(directory, "image_%i.png" % (i // 2)),
+                          colorspace_settings=Namespace(name='sRGB'), alpha_mode='STRAIGHT')
+        textures.append(Namespace(name="texture_%i" % i, type='IMAGE', image=image))
+    return textures
+
+
+def make_materials(count, textures, properties):
+    import mathutils
+
+    bsdfs = ['DIFFUSE', 'ORENNAYAR', 'WARD', 'COOK_TORRANCE', 'GLASS', 'MIRROR']
+    materials = []
+    for i in range(count):
+        settings = {"bsdf": bsdfs[i % len(bsdfs)]}
+        slots = []
+        if textures and i % 4 == 0:
+            settings["diffuse_color_type"] = 'TEX'
+            slots = [Namespace(texture=textures[i % len(textures)])]
+
+        materials.append(Namespace(
+            name="material_%i" % i,
+            diffuse_color=mathutils.Color((0.8, 0.8, 0.8)),
+            specular_color=mathutils.Color((1, 1, 1)),
+            roughness=0.5,
+            texture_slots=slots,
+            pearray=property_defaults(properties.material.PearRayMaterialProperties,
+                                      **settings)))
+    return materials
+
+
+def make_lights(count, properties):
+    import mathutils
+
+    kinds = ['POINT', 'AREA', 'SUN', 'HEMI']
+    lights = []
+    for i in range(count):
+        data = Namespace(name="lamp_%i" % i, type=kinds[i % len(kinds)], shape='SQUARE',
+                         size=1.0, size_y=1.0, color=mathutils.Color((1, 1, 1)),
+                         pearray=property_defaults(properties.light.PearRayLightProperties))
+        lights.append(Namespace(name="light_%i" % i, type='LAMP', data=data,
+                                hide_render=False, layers=SCENE_LAYERS,
+                                matrix_world=mathutils.Matrix.Translation((i, 0, 10))))
+    return lights
+
+
+def make_camera(properties):
+    import mathutils
+
+    data = Namespace(type='PERSP', sensor_width=32.0, sensor_height=18.0, lens=35.0,
+                     pearray=property_defaults(properties.camera.PearRayCameraProperties))
+    return Namespace(name="Camera", type='CAMERA', data=data, hide_render=False, layers=SCENE_LAYERS,
+                     matrix_world=mathutils.Matrix.Translation((0, 0, 50)))
+
+
+def make_scene(objects=10, triangles=200, materials=10, lights=1, textures=0,
+               mesh_format='INLINE', directory=None, hidden=0, culling=False, lod=0):
+    """Scene with objects meshes of the given triangle count each.
+
+    hidden adds as many meshes on a layer the scene does not show, culling
+    enables frustum culling against the camera looking down onto them and
+    a lod density above zero enables the level of detail stage.
+    """
+    import bpy
+    import mathutils
+
+    export, properties = load_addon()
+
+    texture_list = make_textures(textures, directory or ROOT)
+    material_list = make_materials(materials, texture_list, properties)
+    light_list = make_lights(lights, properties)
+    camera = make_camera(properties)
+
+    mesh_list = []
+    for i in range(objects):
+        mats = [material_list[i % len(material_list)]] if material_list else []
+        data = MeshData("mesh_%i" % i, triangles, mats, i)
+        matrix = mathutils.Matrix.Translation((i % 100, i // 100, 0))
+        mesh_list.append(MeshObject("object_%i" % i, data, matrix))
+
+    for i in range(hidden):
+        data = MeshData("hidden_mesh_%i" % i, triangles, material_list[:1], objects + i)
+        matrix = mathutils.Matrix.Translation((i % 100, i // 100, 0))
+        mesh_list.append(MeshObject("hidden_object_%i" % i, data, matrix, OTHER_LAYERS))
+
+    all_objects = [camera] + light_list + mesh_list
+
+    pass_names = ["combined", "z", "normal", "vector", "uv", "object_index", "material_index"]
+    render_layer = Namespace(layers=(True,) * 20, layers_exclude=(False,) * 20,
+                             **dict(("use_pass_%s" % p, p == "combined") for p in pass_names))
+
+    scene = Namespace(
+        name="Scene",
+        frame_current=1,
+        camera=camera,
+        objects=all_objects,
+        layers=SCENE_LAYERS,
+        world=Namespace(horizon_color=mathutils.Color((0.05, 0.05, 0.05))),
+        render=Namespace(resolution_x=1920, resolution_y=1080, resolution_percentage=100,
+                         threads=os.cpu_count() or 1, threads_mode='AUTO',
+                         tile_x=64, tile_y=64, layers=Namespace(active=render_layer)),
+        pearray=property_defaults(properties.scene.PearRaySceneProperties,
+                                  mesh_format=mesh_format, use_culling=culling,
+                                  use_lod=lod > 0, lod_density=lod or 1),
+        pearray_layer=property_defaults(properties.layer.PearRaySceneRenderLayerProperties))
+
+    bpy.data.objects[:] = all_objects
+    bpy.data.materials[:] = material_list
+    bpy.data.textures[:] = texture_list
+    return scene
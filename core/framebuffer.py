@@ -0,0 +1,82 @@
+import time
+import numpy as np
+
+
+class TileFramebuffer:
+    def __init__(self, engine, width, height, tile_x, tile_y):
+        self.engine = engine
+        self.width = width
+        self.height = height
+
+        # Same tile grid as the renderer, in buffer coordinates (top row first)
+        self.row_starts = np.arange(0, height, max(1, tile_y))
+        self.col_starts = np.arange(0, width, max(1, tile_x))
+        row_ends = np.append(self.row_starts[1:], height)
+        col_ends = np.append(self.col_starts[1:], width)
+        self.tiles = [(r0, r1, c0, c1)
+                      for r0, r1 in zip(self.row_starts, row_ends)
+                      for c0, c1 in zip(self.col_starts, col_ends)]
+
+        # NaN never compares equal, so every tile starts dirty
+        self.sums = np.full(len(self.tiles), np.nan)
+        self.results = {}
+
+        # Reused for every refresh, so memory stays flat during long renders
+        self.buffers = {}
+        self.row_sums = np.empty((len(self.row_starts), width, 4), dtype=np.float64)
+        self.tile_sums = np.empty((len(self.row_starts), len(self.col_starts), 4), dtype=np.float64)
+
+        self.refresh_times = []
+        self.refresh_tiles = 0
+
+
+    def _tile_sums(self, arr):
+        np.add.reduceat(arr, self.row_starts, axis=0, dtype=np.float64, out=self.row_sums)
+        np.add.reduceat(self.row_sums, self.col_starts, axis=1, out=self.tile_sums)
+        return self.tile_sums.sum(axis=2).ravel()
+
+
+    def update(self, arr):
+        # arr is the mapped RGBA buffer. Only tiles changed since the last
+        # refresh are copied and handed over as their own render result.
+        start = time.perf_counter()
+
+        sums = self._tile_sums(arr)
+        dirty = np.flatnonzero(sums != self.sums)
+        self.sums = sums
+
+        for i in dirty:
+            r0, r1, c0, c1 = self.tiles[i]
+
+            result = self.results.get(i)
+            if not result:
+                # Blender counts rows from the bottom
+                result = self.engine.begin_result(c0, self.height - r1, c1 - c0, r1 - r0)
+                self.results[i] = result
+                self.buffers[i] = np.empty((r1 - r0, c1 - c0, 4), dtype=np.float32)
+
+            # The flip happens while copying into the reused buffer
+            buffer = self.buffers[i]
+            np.copyto(buffer, arr[r0:r1, c0:c1][::-1])
+            result.layers[0].passes["Combined"].rect = buffer.reshape(-1, 4)
+            self.engine.update_result(result)
+
+        self.refresh_times.append(time.perf_counter() - start)
+        self.refresh_tiles = self.refresh_tiles + len(dirty)
+
+
+    def finish(self):
+        for result in self.results.values():
+            self.engine.end_result(result)
+        self.results = {}
+        self.buffers = {}
+
+
+    def report(self):
+        if not self.refresh_times:
+            return ""
+
+        return "%i refreshes, %i tiles, %.1f ms mean, %.1f ms max" % (
+            len(self.refresh_times), self.refresh_tiles,
+            1000 * sum(self.refresh_times) / len(self.refresh_times),
+            1000 * max(self.refresh_times))
@@ -0,0 +1,48 @@
+import time
+
+
+class RenderMonitor:
+    # Polling starts fast, so short renders end without delay, and backs off
+    # to keep the overhead of long renders low
+    MIN_INTERVAL = 0.005
+    MAX_INTERVAL = 0.05
+    BACKOFF = 1.5
+
+    def __init__(self, is_finished, is_cancelled, clock=time.perf_counter, sleep=time.sleep):
+        self.is_finished = is_finished
+        self.is_cancelled = is_cancelled
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tasks = []
+        # Upper bound of the time between the end of the render and noticing it
+        self.latency = 0
+
+
+    def every(self, interval, callback):
+        # Zero disables the task
+        if interval > 0:
+            self.tasks.append([interval, self.clock() + interval, callback])
+
+
+    def run(self):
+        interval = RenderMonitor.MIN_INTERVAL
+        while True:
+            if self.is_cancelled():
+                return False
+
+            if self.is_finished():
+                return True
+
+            now = self.clock()
+            wait = interval
+            for task in self.tasks:
+                if task[1] <= now:
+                    task[2]()
+                    now = self.clock()
+                    task[1] = now + task[0]
+                wait = min(wait, task[1] - now)
+
+            self.sleep(max(0, wait))
+            self.latency = max(0, wait)
+            interval = min(interval * RenderMonitor.BACKOFF, RenderMonitor.MAX_INTERVAL)
@@ -55,6 +55,7 @@ class RayView(bpy.types.Operator):
             return {'CANCELLED'}
 
         render = scene.render
+        addon_prefs = context.user_preferences.addons[pearray_package.__package__].preferences
 
         scene.frame_set(scene.frame_current)
 
@@ -66,7 +67,9 @@ class RayView(bpy.types.Operator):
             sceneFile = tempfile.NamedTemporaryFile(suffix=".prc").name
 
         self.report({'INFO'}, "PearRay: Exporting data")
-        scene_exporter = export.Exporter(sceneFile, scene)
+        scene_exporter = export.Exporter(sceneFile, scene, addon_prefs.cache_path(),
+                                         addon_prefs.cache_size * 1024 * 1024,
+                                         addon_prefs.cache_max_age * 86400)
         scene_exporter.write_scene()
 
         rayview_binary = RayView._locate_binary()
@@ -10,6 +10,10 @@ import numpy as np
 from collections import deque
 
 from .. import export
+from .monitor import RenderMonitor
+from .framebuffer import TileFramebuffer
+from .session import EngineSession
+from .viewport import ViewportRender
 
 pearray_package = __import__(__name__.split('.')[0])
 
@@ -31,24 +35,37 @@ class PearRayRender(bpy.types.RenderEngine):
         return importlib.import_module("pypearray")
 
 
-    def _proc_wait(self, renderer):
-        time.sleep(0.25)
+    @staticmethod
+    def _load_environment(pr, exporter):
+        if exporter.filename:
+            return pr.SceneLoader.loadFromFile(exporter.filename)
+
+        if hasattr(pr.SceneLoader, "loadFromString"):
+            return pr.SceneLoader.loadFromString(exporter.source)
 
-        # User interrupts the rendering
-        if self.test_break():
+        data = exporter.source.encode()
+
+        # Anonymous memory backed file on Linux
+        if hasattr(os, "memfd_create"):
+            fd = os.memfd_create("pearray_scene")
             try:
-                renderer.stop()
-                print("<<< PEARRAY INTERRUPTED >>>")
-            except OSError:
-                pass
-            return False
-        
-        if renderer.finished:
-            return False
-        
-        return True
+                with os.fdopen(fd, 'wb', closefd=False) as file:
+                    file.write(data)
+                return pr.SceneLoader.loadFromFile("/proc/self/fd/%i" % fd)
+            finally:
+                os.close(fd)
+
+        # Prefer tmpfs over the scratch disk if there is one
+        import tempfile
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        with tempfile.NamedTemporaryFile(suffix=".prc", dir=shm_dir, delete=False) as file:
+            file.write(data)
+        try:
+            return pr.SceneLoader.loadFromFile(file.name)
+        finally:
+            os.remove(file.name)
+
 
-    
     def _handle_render_stat(self, renderer):
         stat = renderer.status
         
@@ -62,12 +79,53 @@ class PearRayRender(bpy.types.RenderEngine):
         self.update_progress(stat.percentage)
 
 
-    def render(self, scene):
-        addon_prefs = bpy.context.user_preferences.addons[pearray_package.__package__].preferences
+    @staticmethod
+    def _create_session(key):
         pr = PearRayRender._setup_package()
-        pr.Logger.instance.verbosity = pr.LogLevel.DEBUG if addon_prefs.verbose else pr.LogLevel.INFO
+        return EngineSession(key, pr, pr.SpectrumDescriptor.createStandardSpectral())
+
+
+    def view_update(self, context):
+        viewport = getattr(self, "viewport", None)
+        if not viewport:
+            pr = PearRayRender._setup_package()
+            viewport = ViewportRender(self, pr, PearRayRender._load_environment)
+            self.viewport = viewport
 
-        specDesc = pr.SpectrumDescriptor.createStandardSpectral()
+        viewport.update(context)
+
+
+    def view_draw(self, context):
+        viewport = getattr(self, "viewport", None)
+        if not viewport:
+            self.view_update(context)
+            viewport = self.viewport
+
+        viewport.update_view(context)
+        viewport.draw(context)
+
+
+    def __del__(self):
+        viewport = getattr(self, "viewport", None)
+        if viewport:
+            viewport.stop()
+
+
+    def render(self, scene):
+        # Animations keep their session up to the last frame, failed and
+        # interrupted renders drop it
+        try:
+            completed = self._render(scene)
+        except:
+            EngineSession.release()
+            raise
+
+        if not completed or scene.frame_current + scene.frame_step > scene.frame_end:
+            EngineSession.release()
+
+
+    def _render(self, scene):
+        addon_prefs = bpy.context.user_preferences.addons[pearray_package.__package__].preferences
 
         import tempfile
         render = scene.render
@@ -75,6 +133,20 @@ class PearRayRender(bpy.types.RenderEngine):
         x = int(render.resolution_x * render.resolution_percentage * 0.01)
         y = int(render.resolution_y * render.resolution_percentage * 0.01)
 
+        # Animations can keep the loaded scene alive between frames
+        session = None
+        if scene.pearray.persistent_session and self.is_animation:
+            key = (bpy.data.filepath, scene.name, x, y)
+            session = EngineSession.acquire(key, lambda: PearRayRender._create_session(key))
+            pr = session.pr
+            specDesc = session.spectrum
+        else:
+            EngineSession.release()
+            pr = PearRayRender._setup_package()
+            specDesc = pr.SpectrumDescriptor.createStandardSpectral()
+
+        pr.Logger.instance.verbosity = pr.LogLevel.DEBUG if addon_prefs.verbose else pr.LogLevel.INFO
+
         print("<<< START PEARRAY >>>")
         blendSceneName = bpy.data.filepath.split(os.path.sep)[-1].split(".")[0]
         if not blendSceneName:
@@ -91,18 +163,57 @@ class PearRayRender(bpy.types.RenderEngine):
         if not render.filepath:
             renderPath = tempfile.gettempdir()
         
+        # Without keep_prc the scene is handed over in memory
         if scene.pearray.keep_prc:
             sceneFile = os.path.normpath(renderPath + "/scene.prc")
-        else:
-            sceneFile = tempfile.NamedTemporaryFile(suffix=".prc").name
 
         
         self.update_stats("", "PearRay: Exporting data")
-        scene_exporter = export.Exporter(sceneFile, scene)
+        scene_exporter = export.Exporter(sceneFile, scene, addon_prefs.cache_path(),
+                                         addon_prefs.cache_size * 1024 * 1024,
+                                         addon_prefs.cache_max_age * 86400)
+        scene_exporter.track_changes = session is not None
+        if addon_prefs.verbose:
+            scene_exporter.profiler.detailed = True
         scene_exporter.write_scene(pr)
 
-        self.update_stats("", "PearRay: Starting render")
-        environment = pr.SceneLoader.loadFromFile(sceneFile)
+        profiler = scene_exporter.profiler
+        self.update_stats("", "PearRay: Starting render (%s)" % profiler.summary())
+        load_start = time.perf_counter()
+        reused = False
+        if session:
+            with profiler.phase("update"):
+                reused = session.update(scene_exporter)
+
+        if reused:
+            environment = session.environment
+            pr_scene = session.pr_scene
+
+            saved = session.load_time - (time.perf_counter() - load_start)
+            self.update_stats("", "PearRay: Reusing session scene (saved %.2fs)" % saved)
+            print("PearRay: session scene reused, saved %.2fs" % saved)
+        else:
+            with profiler.phase("load"):
+                environment = PearRayRender._load_environment(pr, scene_exporter)
+
+            environment.registry.set('/renderer/film/width', x)
+            environment.registry.set('/renderer/film/height', y)
+
+            if addon_prefs.verbose:
+                print("Registry:")
+                print(environment.registry.dump())
+            
+            with profiler.phase("create"):
+                pr_scene = environment.sceneFactory.create()
+            if not pr_scene:
+                EngineSession.release()
+                self.report({'ERROR'}, "PearRay: could not create pearray scene instance")
+                print("<<< PEARRAY FAILED >>>")
+                return
+
+            if session:
+                session.store(scene_exporter, environment, pr_scene, time.perf_counter() - load_start)
+        scene_exporter.source = ''
 
         toneMapper = pr.ToneMapper(x, y)
         toneMapper.colorMode = pr.ToneColorMode.SRGB
@@ -111,19 +222,6 @@ class PearRayRender(bpy.types.RenderEngine):
 
         colorBuffer = pr.ColorBuffer(x,y,pr.ColorBufferMode.RGBA)
 
-        environment.registry.set('/renderer/film/width', x)
-        environment.registry.set('/renderer/film/height', y)
-
-        if addon_prefs.verbose:
-            print("Registry:")
-            print(environment.registry.dump())
-        
-        pr_scene = environment.sceneFactory.create()
-        if not pr_scene:
-            self.report({'ERROR'}, "PearRay: could not create pearray scene instance")
-            print("<<< PEARRAY FAILED >>>")
-            return
-
         factory = pr.RenderFactory(specDesc, pr_scene, environment.registry, renderPath)
 
         addon_prefs = bpy.context.user_preferences.addons[pearray_package.__package__].preferences
@@ -143,42 +241,54 @@ class PearRayRender(bpy.types.RenderEngine):
         if scene.render.threads_mode == 'FIXED':
             threads = scene.render.threads
 
-        renderer.start(scene.render.tile_x, scene.render.tile_y, threads)
-
         # Update image
-        result = self.begin_result(0, 0, x, y)
-        layer = result.layers[0]
+        framebuffer = TileFramebuffer(self, x, y, scene.render.tile_x, scene.render.tile_y)
 
         def update_image():
             colorBuffer.map(toneMapper, renderer.output.spectral)
-            arr = np.array(colorBuffer, copy=False)
-            arr = np.reshape(np.flip(arr,0), (x*y,4), 'C')
-            layer.passes["Combined"].rect = arr
-            self.update_result(result)
-
-        update_image()
-
-        prog_start = time.time()
-        img_start = time.time()
-        while self._proc_wait(renderer):
-            prog_end = time.time() 
-            if addon_prefs.show_progress_interval < (prog_end - prog_start):
-                self._handle_render_stat(renderer)
-                prog_start = prog_end
-
-            if addon_prefs.show_image_interval > 0:
-                img_end = time.time() 
-                if addon_prefs.show_image_interval < (img_end - img_start):
-                    update_image()
-                    img_start = img_end
-
-        update_image()
-        self.end_result(result)
-
-        environment.save(renderer, toneMapper, True)
-
-        if not scene.pearray.keep_prc:
-            os.remove(sceneFile)
-        
-        self.update_stats("", "")
-        print("<<< PEARRAY FINISHED >>>")
\ No newline at end of file
+            framebuffer.update(np.array(colorBuffer, copy=False))
+
+        with profiler.phase("render"):
+            renderer.start(scene.render.tile_x, scene.render.tile_y, threads)
+
+            update_image()
+
+            monitor = RenderMonitor(lambda: renderer.finished, self.test_break)
+            monitor.every(addon_prefs.show_progress_interval, lambda: self._handle_render_stat(renderer))
+            monitor.every(addon_prefs.show_image_interval, update_image)
+
+            # User interrupts the rendering
+            completed = monitor.run()
+            if not completed:
+                try:
+                    renderer.stop()
+                    print("<<< PEARRAY INTERRUPTED >>>")
+                except OSError:
+                    pass
+            elif addon_prefs.verbose:
+                print("PearRay: end of render noticed within %.1f ms" % (monitor.latency * 1000))
+
+            update_image()
+            framebuffer.finish()
+
+        if addon_prefs.verbose:
+            print("PearRay: image updates: %s" % framebuffer.report())
+
+        with profiler.phase("save"):
+            environment.save(renderer, toneMapper, True)
+
+        if not scene.pearray.keep_prc and scene_exporter.sidecar_path:
+            os.remove(scene_exporter.sidecar_path)
+
+        if addon_prefs.verbose:
+            print("PearRay: %s" % profiler.summary())
+
+        if scene.pearray.profile_report:
+            reportFile = os.path.join(renderPath, "%s_profile_%04i.json" % (blendSceneName, scene.frame_current))
+            profiler.save(reportFile)
+            self.update_stats("", "PearRay: %s" % profiler.summary())
+            print("PearRay: profile written to %s" % reportFile)
+        else:
+            self.update_stats("", "")
+        print("<<< PEARRAY FINISHED >>>")
+        return completed
\ No newline at end of file
@@ -0,0 +1,87 @@
+from bpy.app.handlers import persistent
+
+
+class EngineSession:
+    # Kept alive between the frames of an animation render
+    current = None
+
+    def __init__(self, key, pr, spectrum):
+        self.key = key
+        self.pr = pr
+        self.spectrum = spectrum
+
+        self.environment = None
+        self.pr_scene = None
+        self.static_digest = ''
+        self.transforms = {}
+
+        self.load_time = 0
+
+
+    @staticmethod
+    def acquire(key, create):
+        session = EngineSession.current
+        if not session or session.key != key:
+            session = create()
+            EngineSession.current = session
+        return session
+
+
+    @staticmethod
+    def release():
+        EngineSession.current = None
+
+
+    def store(self, exporter, environment, pr_scene, load_time):
+        self.environment = environment
+        self.pr_scene = pr_scene
+        self.static_digest = exporter.static_digest
+        self.transforms = exporter.transforms
+        self.load_time = load_time
+
+
+    def update(self, exporter):
+        # True if the loaded scene could be brought up to date in place
+        if not self.pr_scene or exporter.static_digest != self.static_digest:
+            return False
+
+        changed = dict((name, matrix) for name, matrix in exporter.transforms.items()
+                       if self.transforms.get(name) != matrix)
+        if not self.apply(changed):
+            return False
+
+        self.transforms = exporter.transforms
+        return True
+
+
+    def apply(self, changed):
+        # Moves already loaded entities, without any export
+        if len(changed) and not self._apply_transforms(changed):
+            return False
+
+        self.transforms.update(changed)
+        return True
+
+
+    def _apply_transforms(self, changed):
+        entities = dict((e.name, e) for e in getattr(self.pr_scene, "entities", ()))
+
+        try:
+            for name, matrix in changed.items():
+                entities[name].transform = [list(row) for row in matrix]
+        except (KeyError, AttributeError, TypeError):
+            # Not supported by this pypearray, the scene has to be reloaded
+            self.pr_scene = None
+            return False
+
+        build = getattr(self.pr_scene, "buildTree", None)
+        if build:
+            build()
+
+        return True
+
+
+@persistent
+def release_session(*args):
+    # Render handler, nothing is rendered with the session after a job ends
+    EngineSession.release()
@@ -0,0 +1,287 @@
+import bpy
+import bgl
+import time
+import tempfile
+import threading
+import numpy as np
+
+from .. import export
+from ..export.entity import entity_transform
+from ..export.scene import render_layers, is_renderable
+from .monitor import RenderMonitor
+from .session import EngineSession
+
+pearray_package = __import__(__name__.split('.')[0])
+
+
+# Data blocks whose changes can not be applied to a loaded scene
+EXPORTED_DATA = ('meshes', 'materials', 'textures', 'images', 'lamps', 'cameras', 'worlds', 'scenes')
+
+
+class ViewCameraSettings:
+    zoom = 1
+    fstop = 0
+    apertureRadius = 0
+
+
+class ViewCameraData:
+    def __init__(self, lens, width, height):
+        # The viewport projection doubles the 32mm default sensor and fits
+        # it to the larger side of the region
+        sensor = 64
+        self.type = 'PERSP'
+        self.lens = lens
+        self.sensor_width = sensor * min(1, width / height)
+        self.sensor_height = sensor * min(1, height / width)
+        self.pearray = ViewCameraSettings
+
+
+class ViewCamera:
+    # Stands in for the camera object while rendering the 3d view
+    def __init__(self, matrix_world, data):
+        self.name = '_blender_view'
+        self.matrix_world = matrix_world
+        self.data = data
+
+
+def view_camera(context):
+    rv3d = context.region_data
+    if rv3d.view_perspective == 'CAMERA' and context.scene.camera:
+        return context.scene.camera
+
+    # Orthographic views are rendered with a perspective projection as well
+    data = ViewCameraData(context.space_data.lens, context.region.width, context.region.height)
+    return ViewCamera(rv3d.view_matrix.inverted(), data)
+
+
+def camera_signature(camera):
+    data = camera.data
+    return (camera.name, data.type, data.lens, data.sensor_width, data.sensor_height,
+            data.pearray.zoom, data.pearray.fstop, data.pearray.apertureRadius)
+
+
+class ViewportRender:
+    def __init__(self, engine, pr, load_environment):
+        self.engine = engine
+        self.pr = pr
+        self.load_environment = load_environment
+        self.session = EngineSession(None, pr, pr.SpectrumDescriptor.createStandardSpectral())
+
+        self.exporter = None
+        self.camera = None
+        self.size = (0, 0)
+
+        self.factory = None
+        self.renderer = None
+        self.toneMapper = None
+        self.colorBuffer = None
+
+        self.stopped = threading.Event()
+        self.watcher = None
+
+        self.image = None
+        self.pixels = None
+        self.mapped = 0
+        self.final = False
+
+
+    def update(self, context):
+        # Called on scene changes, everything which only moved is applied in place
+        scene = context.scene
+        camera = view_camera(context)
+        size = (context.region.width, context.region.height)
+
+        changed = None
+        if self.session.pr_scene and size == self.size and \
+           camera_signature(camera) == self.camera and not self._data_updated():
+            changed = self._moved_objects(scene)
+
+        if changed is not None and not len(changed):
+            return
+
+        # The renderer has to be idle while the scene is modified
+        self.stop()
+        if changed is None or not self.session.apply(changed):
+            if not self._reload(scene, camera, size):
+                return
+
+        self.restart(scene)
+
+
+    def update_view(self, context):
+        # The 3d view itself does not trigger view_update
+        camera = view_camera(context)
+        size = (context.region.width, context.region.height)
+
+        if not self.session.pr_scene or size != self.size or camera_signature(camera) != self.camera:
+            self.update(context)
+            return
+
+        transform = entity_transform(self.exporter, camera)
+        if self.session.transforms.get(camera.name) == transform:
+            return
+
+        self.stop()
+        if not self.session.apply({camera.name: transform}):
+            if not self._reload(context.scene, camera, size):
+                return
+
+        self.restart(context.scene)
+
+
+    def _data_updated(self):
+        for name in EXPORTED_DATA:
+            if getattr(bpy.data, name).is_updated:
+                return True
+
+        return False
+
+
+    def _moved_objects(self, scene):
+        # None if any update needs a new export
+        changed = {}
+        if not bpy.data.objects.is_updated:
+            return changed
+
+        layers = render_layers(scene)
+        for obj in scene.objects:
+            if not obj.is_updated:
+                continue
+
+            # Objects moved to other layers have to be added or removed,
+            # cameras render from any layer
+            hidden = obj.type != 'CAMERA' and not is_renderable(scene, obj, layers)
+            if obj.is_updated_data or hidden or obj.name not in self.session.transforms:
+                return None
+
+            changed[obj.name] = entity_transform(self.exporter, obj)
+
+        return changed
+
+
+    def _reload(self, scene, camera, size):
+        addon_prefs = bpy.context.user_preferences.addons[pearray_package.__package__].preferences
+
+        self.engine.update_stats("", "PearRay: Exporting data")
+        exporter = export.Exporter('', scene, addon_prefs.cache_path(),
+                                   addon_prefs.cache_size * 1024 * 1024,
+                                   addon_prefs.cache_max_age * 86400)
+        exporter.camera = camera
+        exporter.use_culling = False
+        exporter.use_lod = False
+        exporter.texture_downscale = False
+        exporter.mesh_format = 'INLINE'
+        exporter.track_changes = True
+        exporter.write_scene(self.pr)
+
+        # The film size is not part of the export
+        if size != self.size:
+            self.session.pr_scene = None
+
+        self.exporter = exporter
+        self.camera = camera_signature(camera)
+        self.size = size
+
+        if self.session.update(exporter):
+            exporter.source = ''
+            return True
+
+        environment = self.load_environment(self.pr, exporter)
+        environment.registry.set('/renderer/film/width', size[0])
+        environment.registry.set('/renderer/film/height', size[1])
+
+        pr_scene = environment.sceneFactory.create()
+        exporter.source = ''
+        if not pr_scene:
+            self.session.pr_scene = None
+            self.engine.report({'ERROR'}, "PearRay: could not create pearray scene instance")
+            return False
+
+        self.session.store(exporter, environment, pr_scene, 0)
+
+        self.factory = self.pr.RenderFactory(self.session.spectrum, pr_scene,
+                                             environment.registry, tempfile.gettempdir())
+
+        self.toneMapper = self.pr.ToneMapper(size[0], size[1])
+        self.toneMapper.colorMode = self.pr.ToneColorMode.SRGB
+        self.toneMapper.gammaMode = self.pr.ToneGammaMode.NONE
+        self.toneMapper.mapperMode = self.pr.ToneMapperMode.NONE
+
+        self.colorBuffer = self.pr.ColorBuffer(size[0], size[1], self.pr.ColorBufferMode.RGBA)
+
+        self.image = np.empty((size[1], size[0], 4), dtype=np.float32)
+        self.pixels = bgl.Buffer(bgl.GL_FLOAT, self.image.size)
+        return True
+
+
+    def restart(self, scene):
+        # Progressive sampling starts over with every change
+        self.stop()
+
+        renderer = self.factory.create()
+        if not renderer:
+            self.engine.report({'ERROR'}, "PearRay: could not create pearray render instance")
+            return
+
+        self.session.environment.setup(renderer)
+
+        threads = 0
+        if scene.render.threads_mode == 'FIXED':
+            threads = scene.render.threads
+
+        renderer.start(scene.render.tile_x, scene.render.tile_y, threads)
+        self.renderer = renderer
+        self.mapped = 0
+        self.final = False
+
+        addon_prefs = bpy.context.user_preferences.addons[pearray_package.__package__].preferences
+        monitor = RenderMonitor(lambda: renderer.finished, self.stopped.is_set)
+        monitor.every(1.0 / addon_prefs.viewport_fps, self.engine.tag_redraw)
+
+        def watch():
+            monitor.run()
+            # Show the final image as well
+            self.engine.tag_redraw()
+
+        self.stopped.clear()
+        self.watcher = threading.Thread(target=watch, daemon=True)
+        self.watcher.start()
+        self.engine.update_stats("", "PearRay: Rendering")
+
+
+    def stop(self):
+        self.stopped.set()
+        if self.watcher:
+            self.watcher.join()
+            self.watcher = None
+
+        if self.renderer:
+            try:
+                self.renderer.stop()
+            except OSError:
+                pass
+            self.renderer = None
+
+
+    def draw(self, context):
+        if not self.renderer:
+            return
+
+        # Mapping the buffer is the expensive part, it is limited to the
+        # viewport frame rate while redraws reuse the last pixels
+        addon_prefs = context.user_preferences.addons[pearray_package.__package__].preferences
+        now = time.perf_counter()
+        if not self.final and now - self.mapped >= 1.0 / addon_prefs.viewport_fps:
+            self.final = self.renderer.finished
+            self.colorBuffer.map(self.toneMapper, self.renderer.output.spectral)
+            # OpenGL counts rows from the bottom
+            np.copyto(self.image, np.array(self.colorBuffer, copy=False)[::-1])
+            self.pixels[:] = self.image.ravel().tolist()
+            self.mapped = now
+
+        width, height = self.size
+        bgl.glEnable(bgl.GL_BLEND)
+        bgl.glBlendFunc(bgl.GL_ONE, bgl.GL_ONE_MINUS_SRC_ALPHA)
+        bgl.glRasterPos2i(0, 0)
+        bgl.glDrawPixels(width, height, bgl.GL_RGBA, bgl.GL_FLOAT, self.pixels)
+        bgl.glDisable(bgl.GL_BLEND)
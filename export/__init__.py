@@ -3,62 +3,139 @@ import mathutils
 import math
 import tempfile
 import os
+import io
+import hashlib
+import concurrent.futures
+import multiprocessing
 
 from .scene import write_scene
+from .mesh import mesh_digest
+from .names import NameRegistry
+from .writer import Writer, Sidecar
+from .cache import GeometryCache, TextureCache
+from .profiler import Profiler
 
 
-class Writer:
-    def __init__(self, file, useTabs=True):
-        self.file = file
-        self.useTabs = useTabs
-        self.currentLevel = 0
+# Texture preparation is mostly waiting for the disk
+TEXTURE_WORKERS = 4
 
 
-    def write(self, str):
-        prefix = ""
-        if self.useTabs:
-            for i in range(self.currentLevel):
-                prefix = prefix + "\t"
-        
-        self.file.write(prefix + str + "\n")
+# Shared with the forked workers, see create_process_pool
+_start_barrier = None
 
-    
-    def goIn(self):
-        self.currentLevel = self.currentLevel + 1
-    
 
-    def goOut(self):
-        self.currentLevel = self.currentLevel - 1
-        if self.currentLevel < 0:
-            print("DEV ERROR: PEARRAY Exporter currentLevel < 0!")
-    
+def _worker_started():
+    # Blocks until every worker runs this, so each of them takes one
+    _start_barrier.wait(30)
+
+
+def create_process_pool(workers):
+    # Workers have to inherit the loaded addon by forking, a freshly spawned
+    # interpreter can not import bpy
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+
+    context = multiprocessing.get_context('fork')
+    try:
+        pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=context)
+    except TypeError:# Python < 3.7 always forks on posix
+        pool = concurrent.futures.ProcessPoolExecutor(workers)
+
+    # The executor forks on demand, start every worker before the texture
+    # threads exist. Forking while they hold a lock can deadlock the child.
+    global _start_barrier
+    _start_barrier = context.Barrier(workers)
+    concurrent.futures.wait([pool.submit(_worker_started) for i in range(workers)])
+    return pool
+
 
 class Exporter:
-    def __init__(self, filename, scene):
+    def __init__(self, filename, scene, cache_dir='', cache_size=0, cache_age=0):
+        # Without a filename the scene is kept in memory, see source
         self.filename = filename
         self.file = None
+        self.source = ''
 
         self.scene = scene
 
         self.instances = {}
-        self.instances["MESH"] = []
-        self.instances["MATERIAL"] = []
-        self.instances["TEXTURE"] = []
-        self.instances["SPEC"] = []
+        self.instances["MESH"] = NameRegistry()
+        self.instances["MATERIAL"] = NameRegistry()
+        self.instances["TEXTURE"] = NameRegistry()
+        self.instances["SPEC"] = NameRegistry()
 
         self.mesh_cache = {}
+        self.mesh_instances = {}
+        # Exported texture names by texture name and by image source
+        self.texture_names = {}
+        self.texture_sources = {}
+        # Prepared images by image name, see texture.queue_image
+        self.image_jobs = {}
+        # Screen extent in pixels by image name, only with texture_downscale
+        self.image_footprints = {}
+        # Spectrum names by their data, see spectral.write_spectrum
+        self.spectra = {}
+        # Exported material names by material name and by signature, see
+        # material.material_name
+        self.material_names = {}
+        self.material_signatures = {}
+        self.texture_pool = concurrent.futures.ThreadPoolExecutor(TEXTURE_WORKERS)
         self.MISSING_MAT = ''
 
+        self.w = None
+        self.sidecar = None
+        self.sidecar_path = ''
+        self.sidecar_written = 0
+
+        self.profiler = Profiler(self.bytes_written, scene.pearray.profile_report)
+
+        self.pool = None
+
+        self.geometry_cache = None
+        if cache_dir and scene.pearray.use_geometry_cache:
+            self.geometry_cache = GeometryCache(
+                os.path.join(cache_dir, "geometry"), cache_size, cache_age)
+
+        # Without a cache directory encoded images are kept next to the scene file
+        texture_dir = ''
+        if cache_dir:
+            texture_dir = os.path.join(cache_dir, "textures")
+        elif filename and scene.pearray.keep_prc:
+            texture_dir = os.path.join(os.path.dirname(filename), "generated", "textures")
+
+        self.texture_cache = None
+        if texture_dir and scene.pearray.use_texture_cache:
+            self.texture_cache = TextureCache(texture_dir, cache_size, cache_age)
+
+        # Viewport renders move the camera without a new export, so they
+        # can not cull, decimate or downscale by it. They also keep meshes
+        # inline, every reload would leave another sidecar behind.
+        self.use_culling = scene.pearray.use_culling
+        self.use_lod = scene.pearray.use_lod
+        self.texture_downscale = scene.pearray.texture_downscale
+        self.mesh_format = scene.pearray.mesh_format
+        # Level of detail by object name, see scene.choose_lod_levels
+        self.lod_levels = {}
+
+        # Entity transforms and a digest of everything else, used to find
+        # out what changed between two exports
+        self.track_changes = False
+        self.transforms = {}
+        self.static_digest = ''
+
         self.M_WORLD = mathutils.Matrix.Identity(4)
         #print(self.M_WORLD)
         self.LIGHT_POW_F = 1
 
         self.render = scene.render
         self.world = scene.world
+        # Replaced by the view for viewport renders
+        self.camera = scene.camera
     
     
     def create_file(self, name_hint=""):
-        if self.scene.pearray.keep_prc:
+        # Scenes kept in memory have no directory to keep files in
+        if self.filename and self.scene.pearray.keep_prc:
             dir = os.path.join(os.path.dirname(self.filename), "generated");
             if not os.path.exists(dir):
                 os.mkdir(dir)
@@ -71,45 +148,98 @@ class Exporter:
             return tempfile.NamedTemporaryFile(delete=False).name
 
 
-    def register_unique_name(self, type, name):
-        test_name = name
-        i = 1
-        while test_name in self.instances[type]:
-            test_name = "%s_%i" % (name, i)
-            i = i + 1
-        self.instances[type].append(test_name)
+    def mesh_sidecar(self):
+        if not self.sidecar:
+            self.sidecar_path = self.create_file(name_hint="meshes.bin")
+            self.sidecar = Sidecar(self.sidecar_path)
+
+        return self.sidecar
+
+
+    def bytes_written(self):
+        written = self.sidecar_written
+        if self.w:
+            written = written + self.w.written
+        if self.sidecar:
+            written = written + self.sidecar.written
+        return written
 
-        return test_name
+
+    def register_unique_name(self, type, name):
+        return self.instances[type].register(name)
 
 
     def register_mesh_data(self, name, data):
-        for n, d in self.mesh_cache.items():
-            lengthEq = True
-            for i in range(len(d)):
-                lengthEq = lengthEq and len(d[i]) == len(data[i])
-            
-            if lengthEq and d == data:
-                return n, True
+        return self.register_mesh_digest(name, mesh_digest(data))
+
+
+    def register_mesh_digest(self, name, digest):
+        if self.w.digest:
+            self.w.digest.update(digest)
+
+        if digest in self.mesh_cache:
+            return self.mesh_cache[digest], True
 
         # No name check... should be done somewhere else 
-        self.mesh_cache[name] = data
+        self.mesh_cache[digest] = name
 
         return name, False
     
     def write_scene(self, pr):
-        self.file = open(self.filename, 'w')
+        with self.profiler.phase("export"):
+            self._write_scene(pr)
+
+
+    def _write_scene(self, pr):
+        if self.filename:
+            self.file = open(self.filename, 'w')
+        else:
+            self.file = io.StringIO()
         self.w = Writer(self.file, self.scene.pearray.beautiful_prc)
+        if self.track_changes:
+            self.w.digest = hashlib.sha1()
+
+        if self.scene.pearray.use_export_pipeline and self.mesh_format == 'INLINE':
+            workers = max(1, self.render.threads)
+            self.pool = create_process_pool(workers)
+            self.w.max_fragments = 2 * workers
+
+        # Evict before anything is looked up, entries used by this export
+        # have to stay alive until the scene is loaded
+        if self.geometry_cache:
+            self.geometry_cache.evict()
+        if self.texture_cache:
+            self.texture_cache.evict()
 
         import datetime
         self.file.write("; generated by pearray exporter v0.3 with blender %s\n" % bpy.app.version_string)
         self.file.write("; at %s\n" % datetime.datetime.now())
 
         scene.write_scene(self, pr)
-        self.close()
+        with self.profiler.phase("close"):
+            self.close()
         
     
     def close(self):
+        self.w.flush()
+        if self.w.digest:
+            self.static_digest = self.w.digest.hexdigest()
+        if not self.filename:
+            self.source = self.file.getvalue()
         self.file.close()
 
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+        # Images queued but never referenced still have to be complete
+        # before the scene is loaded
+        self.texture_pool.shutdown()
+
+        if self.sidecar:
+            self.sidecar_written = self.sidecar.written
+            self.sidecar.close()
+            self.sidecar = None
+
         if self.w.currentLevel > 0:
             print("DEV ERROR: PEARRAY Exporter currentLevel > 0 in the end!")
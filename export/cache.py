@@ -0,0 +1,270 @@
+import os
+import time
+import hashlib
+import tempfile
+import numpy as np
+
+from .writer import Sidecar
+
+
+# Bump whenever the layout of cached entries changes
+CACHE_VERSION = 1
+
+
+class DiskCache:
+    def __init__(self, directory, max_size, max_age=0):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+
+    def temp_path(self, key):
+        # Concurrent stores of the same key never share a temporary file
+        fd, temp = tempfile.mkstemp(prefix=key + ".", suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        return temp
+
+
+    def store_file(self, key, ext, save):
+        # save writes the file to the given path. The entry only appears
+        # once it is complete.
+        path = self.path(key, ext)
+        temp = self.temp_path(key)
+        try:
+            save(temp)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return path
+
+
+    def lookup(self, key, ext):
+        path = self.path(key, ext)
+        if not os.path.exists(path):
+            return None
+
+        # The modification time is used as last access for the LRU order
+        os.utime(path, None)
+        return path
+
+
+    def entries(self):
+        # All files sharing the same key form one entry of their total size,
+        # last access and paths
+        entries = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            key = entry.name.split('.')[0]
+            size, mtime, paths = entries.get(key, (0, 0, []))
+            paths.append(entry.path)
+            entries[key] = (size + stat.st_size, max(mtime, stat.st_mtime), paths)
+
+        return entries
+
+
+    def remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def evict(self):
+        if self.max_size <= 0 and self.max_age <= 0:
+            return
+
+        entries = self.entries()
+
+        # Entries not used for max_age seconds are stale
+        if self.max_age > 0:
+            limit = time.time() - self.max_age
+            for key, (_, mtime, paths) in list(entries.items()):
+                if mtime < limit:
+                    self.remove(paths)
+                    del entries[key]
+
+        if self.max_size <= 0:
+            return
+
+        total = sum(size for size, _, _ in entries.values())
+
+        for key, (size, _, paths) in sorted(entries.items(), key=lambda e: e[1][1]):
+            if total <= self.max_size:
+                break
+
+            self.remove(paths)
+            total = total - size
+
+
+# Modifiers whose result depends on simulation or file state instead of
+# their settings alone
+SIMULATION_MODIFIERS = {
+    'CLOTH', 'SOFT_BODY', 'COLLISION', 'DYNAMIC_PAINT', 'SMOKE',
+    'FLUID_SIMULATION', 'PARTICLE_SYSTEM', 'PARTICLE_INSTANCE', 'EXPLODE',
+    'MESH_CACHE', 'MESH_SEQUENCE_CACHE',
+}
+
+
+def is_cacheable(obj):
+    # Modifiers reading other datablocks, like boolean cutters, armatures or
+    # displacement textures, change the result without changing themselves
+    for mod in obj.modifiers:
+        if mod.type in SIMULATION_MODIFIERS:
+            return False
+
+        for prop in mod.bl_rna.properties:
+            if prop.type == 'POINTER' and hasattr(getattr(mod, prop.identifier, None), 'users'):
+                return False
+
+    return True
+
+
+def rna_signature(struct):
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier == 'rna_type' or prop.type == 'COLLECTION':
+            continue
+
+        value = getattr(struct, prop.identifier, None)
+        if prop.type == 'POINTER':
+            values.append(getattr(value, 'name', None))
+        elif getattr(prop, 'is_array', False):
+            values.append(tuple(value))
+        else:
+            values.append(value)
+
+    return repr(values)
+
+
+def _hash_collection(digest, collection, attr, dtype, width=1):
+    arr = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, arr)
+    digest.update(arr.data)
+
+
+class GeometryCache(DiskCache):
+    def geometry_key(self, obj, mesh_format, frame):
+        # None if the object can not be cached
+        if not is_cacheable(obj):
+            return None
+
+        mesh = obj.data
+        digest = hashlib.sha1()
+
+        digest.update(("%i;%s;%s;%i;%f" % (CACHE_VERSION, mesh.name, mesh_format,
+                                          mesh.use_auto_smooth,
+                                          mesh.auto_smooth_angle)).encode())
+
+        # Undeformed mesh data
+        _hash_collection(digest, mesh.vertices, "co", np.float32, 3)
+        _hash_collection(digest, mesh.loops, "vertex_index", np.int32)
+        _hash_collection(digest, mesh.polygons, "loop_total", np.int32)
+        _hash_collection(digest, mesh.polygons, "use_smooth", bool)
+        _hash_collection(digest, mesh.polygons, "material_index", np.int32)
+
+        if mesh.uv_layers.active:
+            _hash_collection(digest, mesh.uv_layers.active.data, "uv",
+                             np.float32, 2)
+        if mesh.vertex_colors.active:
+            _hash_collection(digest, mesh.vertex_colors.active.data, "color",
+                             np.float32, 3)
+
+        if mesh.shape_keys:
+            for block in mesh.shape_keys.key_blocks:
+                digest.update(("%s;%f;%i" % (block.name, block.value,
+                                            block.mute)).encode())
+                _hash_collection(digest, block.data, "co", np.float32, 3)
+
+        # Modifier stack settings, some like wave animate by themselves
+        if obj.modifiers:
+            digest.update(("%i" % frame).encode())
+            digest.update(repr([tuple(r) for r in obj.matrix_world]).encode())
+            for mod in obj.modifiers:
+                digest.update(rna_signature(mod).encode())
+
+        return digest.hexdigest()
+
+
+    def load(self, key):
+        path = self.lookup(key, ".prc")
+        if not path:
+            return None
+
+        with open(path, 'r') as file:
+            header = file.readline()
+            block = file.read()
+
+        if not header.startswith("; "):
+            return None
+
+        # Binary entries need their sidecar as well
+        if ":file '" in block and not self.lookup(key, ".bin"):
+            return None
+
+        return bytes.fromhex(header[2:].strip()), block
+
+
+    def sidecar(self, key):
+        # Written to a temporary file, store moves it in place
+        return Sidecar(self.path(key, ".bin"), self.temp_path(key))
+
+
+    def store(self, key, digest, block, sidecar=None):
+        # The sidecar has to be complete before the block referencing it
+        # appears
+        if sidecar:
+            sidecar.close()
+            os.replace(sidecar.file_path, sidecar.path)
+
+        def save(path):
+            with open(path, 'w') as file:
+                file.write("; %s\n" % digest.hex())
+                file.write(block)
+
+        self.store_file(key, ".prc", save)
+
+
+def image_key(image, scene):
+    # Identifies an encoded packed or generated image. Painted images are
+    # never cached, hashing their pixels costs more than encoding them.
+    digest = hashlib.sha1()
+
+    digest.update(("%i;%s;%s;%s;%s" % (CACHE_VERSION, image.source,
+                                      image.colorspace_settings.name,
+                                      image.alpha_mode,
+                                      image.use_view_as_render)).encode())
+
+    # Encoded data of packed images, settings of generated ones
+    if image.packed_file:
+        digest.update(image.packed_file.data)
+    elif image.source == 'GENERATED':
+        digest.update(("%s;%i;%i;%s;%i" % (image.generated_type,
+                                           image.generated_width,
+                                           image.generated_height,
+                                           tuple(image.generated_color),
+                                           image.use_generated_float)).encode())
+
+    # Everything save_render applies while encoding
+    digest.update(rna_signature(scene.render.image_settings).encode())
+    digest.update(rna_signature(scene.view_settings).encode())
+    digest.update(rna_signature(scene.display_settings).encode())
+
+    return digest.hexdigest()
+
+
+class TextureCache(DiskCache):
+    def store(self, key, ext, save):
+        # save writes the encoded image to the given path
+        return self.store_file(key, ext, save)
@@ -4,6 +4,19 @@ import math
 from .entity import inline_entity_matrix
 
 
+def camera_plane(scene, camera):
+    # Width and height of the image plane at distance one, or of the
+    # orthographic view, which the engine stretches over the frame
+    data = camera.data
+    if data.type == 'ORTHO':
+        render = scene.render
+        size = max(render.resolution_x, render.resolution_y)
+        return (data.ortho_scale * render.resolution_x / size,
+                data.ortho_scale * render.resolution_y / size)
+
+    return (data.sensor_width/data.lens, data.sensor_height/data.lens)
+
+
 def export_camera(exporter, camera):
     w = exporter.w
     scene = exporter.scene
@@ -16,11 +29,10 @@ def export_camera(exporter, camera):
 
     if camera.data.type == 'ORTHO':
         w.write(":projection 'ortho'")
-        w.write(":width %f" % (camera.data.ortho_scale * aspectW))
-        w.write(":height %f" % (camera.data.ortho_scale * aspectH))
-    else:
-        w.write(":width %f" % (camera.data.sensor_width/camera.data.lens))
-        w.write(":height %f" % (camera.data.sensor_height/camera.data.lens))
+
+    width, height = camera_plane(scene, camera)
+    w.write(":width %f" % width)
+    w.write(":height %f" % height)
 
     w.write(":zoom %f" % camera.data.pearray.zoom)
     w.write(":fstop %f" % camera.data.pearray.fstop)
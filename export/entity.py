@@ -2,6 +2,12 @@ import math
 import mathutils
 
 # Blender uses M = Translation * Rotation * Scale
+def entity_transform(exporter, obj):
+    matrix = exporter.M_WORLD * obj.matrix_world
+    return tuple(tuple(matrix[i]) for i in range(4))
+
+
 def inline_entity_matrix(exporter, obj):
     matrix = exporter.M_WORLD * obj.matrix_world
-    exporter.w.write(":transform [" + ",".join([",".join(map(str, matrix[i])) for i in range(4)]) + "]")
+    exporter.transforms[obj.name] = entity_transform(exporter, obj)
+    exporter.w.write_volatile(":transform [" + ",".join([",".join(map(str, matrix[i])) for i in range(4)]) + "]")
@@ -200,8 +200,10 @@ def export_material_grid(exporter, material):
     inline_material_defaults(exporter, material)
 
     exporter.w.write(":type 'grid'")
-    exporter.w.write(":first '%s'" % material.pearray.grid_first_material)
-    exporter.w.write(":second '%s'" % material.pearray.grid_second_material)
+    exporter.w.write(":first '%s'" % exporter.material_names.get(
+        material.pearray.grid_first_material, material.pearray.grid_first_material))
+    exporter.w.write(":second '%s'" % exporter.material_names.get(
+        material.pearray.grid_second_material, material.pearray.grid_second_material))
     exporter.w.write(":gridCount '%i'" % material.pearray.grid_count)
     exporter.w.write(":tileUV '%s'" % material.pearray.grid_tile_uv)
 
@@ -254,6 +256,62 @@ def export_color(exporter, material, type, required, factor=1):
         return ""
 
 
+def color_signature(material, type):
+    # Everything export_color reads for the given type
+    sub_mat = material
+    if not hasattr(material, type):
+        sub_mat = material.pearray
+
+    mode = getattr(material.pearray, "%s_type" % type)
+    if mode == 'COLOR':
+        return (mode, "%f %f %f" % tuple(getattr(sub_mat, type)[:]))
+    elif mode == 'TEX':
+        if len(material.texture_slots) <= 0:
+            return (mode, None)
+
+        tex_slot = getattr(material.pearray, "%s_tex_slot" % type)
+        if not tex_slot or tex_slot >= len(material.texture_slots):
+            tex_slot = 0
+        texture = material.texture_slots[tex_slot].texture
+        if texture and texture.type == 'IMAGE' and texture.image:
+            # Textures sharing an image are exported as one
+            return (mode, "image", texture.image.name)
+        return (mode, "texture", texture.name if texture else None)
+    else:
+        return (mode, getattr(material.pearray, "%s_temp_type" % type),
+                "%f %f" % (getattr(material.pearray, "%s_temp" % type),
+                           getattr(material.pearray, "%s_temp_factor" % type)))
+
+
+def material_signature(material):
+    # Identical for materials giving the same exported block except the name
+    pr = material.pearray
+    return (pr.bsdf, pr.cast_shadows, pr.cast_self_shadows, pr.is_shadeable, pr.is_camera_visible,
+            color_signature(material, 'diffuse_color'),
+            color_signature(material, 'specular_color'),
+            color_signature(material, 'emission_color'),
+            "%f %f %f %f %f" % (material.roughness, pr.reflectivity, pr.spec_roughness_x,
+                                pr.spec_roughness_y, pr.specular_ior_value),
+            pr.specular_ior_type, "%f %f %f" % tuple(pr.specular_ior_color[:]),
+            pr.ct_fresnel_mode, pr.ct_distribution_mode, pr.ct_geometry_mode, pr.glass_is_thin,
+            pr.grid_first_material, pr.grid_second_material, pr.grid_count, pr.grid_tile_uv)
+
+
+def material_name(exporter, material):
+    # The name a material is exported as. With merge_materials the first of
+    # all identical materials stands in for the others.
+    name = exporter.material_names.get(material.name)
+    if name:
+        return name
+
+    name = material.name
+    if exporter.scene.pearray.merge_materials:
+        name = exporter.material_signatures.setdefault(material_signature(material), name)
+
+    exporter.material_names[material.name] = name
+    return name
+
+
 def export_material(exporter, material):
     if not material:
         return
@@ -261,6 +319,9 @@ def export_material(exporter, material):
     if material.name in exporter.instances['MATERIAL']:
         return
 
+    if material_name(exporter, material) != material.name:
+        return
+
     exporter.register_unique_name('MATERIAL', material.name)
 
     bsdf = material.pearray.bsdf
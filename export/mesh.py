@@ -1,16 +1,58 @@
 import collections
+import hashlib
+import io
 import bpy
 import mathutils
+import numpy as np
+from .material import material_name
 from .entity import inline_entity_matrix
+from .writer import Writer
 
 
-def export_trimesh(exporter, mw, name, mesh):
-    w = exporter.w
+TriMesh = collections.namedtuple(
+    'TriMesh',
+    ['points', 'normals', 'uvs', 'colors', 'face_indices', 'material_indices'])
 
-    # First collect vertex data
-    faces = mesh.tessfaces[:]
-    uv_tex = mesh.tessface_uv_textures
+# Every level of detail has about a fourth of the triangles of the last
+MAX_LOD_LEVEL = 6
+
+# Box corners by their x, y and z bit and the outside facing quads
+BOX_BITS = np.array([[(i >> 2) & 1, (i >> 1) & 1, i & 1] for i in range(8)], dtype=np.float32)
+BOX_QUADS = np.array([[0, 1, 3, 2], [4, 6, 7, 5], [0, 4, 5, 1],
+                      [2, 3, 7, 6], [0, 2, 6, 4], [1, 5, 7, 3]])
+BOX_NORMALS = np.array([[-1, 0, 0], [1, 0, 0], [0, -1, 0],
+                        [0, 1, 0], [0, 0, -1], [0, 0, 1]], dtype=np.float32)
+
+
+def _foreach_get(collection, attr, count, dtype, width=1):
+    arr = np.empty(count * width, dtype=dtype)
+    collection.foreach_get(attr, arr)
+    if width > 1:
+        return arr.reshape(count, width)
+    return arr
+
+
+def mesh_digest(data):
+    digest = hashlib.sha1()
+    for array in data:
+        if array is None:
+            digest.update(b'none')
+        else:
+            array = np.ascontiguousarray(array)
+            digest.update(("%s%s" % (array.dtype.str, array.shape)).encode())
+            digest.update(array.data)
 
+    return digest.digest()
+
+
+def extract_trimesh(mesh):
+    # Bulk version of walking every tessface corner: smooth corners with equal
+    # data are welded, flat corners stay unique and quads become two triangles.
+    faces = mesh.tessfaces
+    face_count = len(faces)
+    vert_count = len(mesh.vertices)
+
+    uv_tex = mesh.tessface_uv_textures
     if len(uv_tex) > 0 and uv_tex.active and uv_tex.active.data:
         uv_layer = uv_tex.active.data
     else:
@@ -22,184 +64,415 @@ def export_trimesh(exporter, mw, name, mesh):
     else:
         color_layer = None
 
-    face_indices = []
-    material_indices = []
-    points = []
-    normals = []
-    uvs = []
-    colors = []
-
-    # Temporary
-    vert_index = 0
-    vert_indices = {}
-    vert_cache = set()
-
-    for face in faces:
-        face_data = []
-
-        for j, vertex in enumerate(face.vertices):
-            v = mesh.vertices[vertex]
-
-            if uv_layer:
-                uv = uv_layer[face.index].uv[j]
-
-            if color_layer:
-                if j == 0:
-                    color = color_layer[face.index].color1
-                elif j == 1:
-                    color = color_layer[face.index].color2
-                elif j == 2:
-                    color = color_layer[face.index].color3
-                elif j == 3:
-                    color = color_layer[face.index].color4
-
-            if face.use_smooth:
-                if uv_layer:
-                    if color_layer:
-                        vert_data = (v.co[:], v.normal[:], uv[:], color[:])
-                    else:
-                        vert_data = (v.co[:], v.normal[:], uv[:])
-                else:
-                    if color_layer:
-                        vert_data = (v.co[:], v.normal[:], color[:])
-                    else:
-                        vert_data = (v.co[:], v.normal[:])
-
-                if vert_data not in vert_cache:
-                    vert_cache.add(vert_data)
-
-                    points.append(vert_data[0])
-                    normals.append(vert_data[1])
-
-                    if uv_layer:
-                        uvs.append(vert_data[2])
-
-                    if color_layer:
-                        colors.append(vert_data[-1])
-
-                    vert_indices[vert_data] = vert_index
-                    face_data.append(vert_index)
-
-                    vert_index += 1
-                else:
-                    face_data.append(vert_indices[vert_data])
-            else:
-                # They are always unique
-                points.append(v.co[:])
-                normals.append(face.normal[:])
-
-                if uv_layer:
-                    uvs.append(uv[:])
-
-                if color_layer:
-                    colors.append(color[:])
-
-                face_data.append(vert_index)
-
-                vert_index += 1
-
-        face_indices.append(face_data[0:3])
-        material_indices.append(face.material_index)
-        if len(face_data) == 4:  # Triangulate
-            face_indices.append((face_data[0], face_data[2], face_data[3]))
-            material_indices.append(face.material_index)
-
-    del vert_indices
-    del vert_cache
-
-    n, in_cache = exporter.register_mesh_data(
-        name, (points, normals, uvs, colors, face_indices, material_indices))
-    if in_cache:
-        return n
+    vert_co = _foreach_get(mesh.vertices, "co", vert_count, np.float32, 3)
+    vert_no = _foreach_get(mesh.vertices, "normal", vert_count, np.float32, 3)
 
-    w.write("(mesh")
-    w.goIn()
+    face_verts = _foreach_get(faces, "vertices_raw", face_count, np.int32, 4)
+    face_no = _foreach_get(faces, "normal", face_count, np.float32, 3)
+    face_smooth = _foreach_get(faces, "use_smooth", face_count, bool)
+    face_mat = _foreach_get(faces, "material_index", face_count, np.int32)
 
-    w.write(":name '%s'" % name)
-    w.write(":type 'triangles'")
+    # Tessfaces are triangles when the fourth index is zero
+    corner_valid = np.ones((face_count, 4), dtype=bool)
+    corner_valid[:, 3] = face_verts[:, 3] != 0
+
+    corner_face = np.nonzero(corner_valid)[0]
+    corner_vert = face_verts[corner_valid]
+    corner_smooth = face_smooth[corner_face]
+
+    attributes = [
+        vert_co[corner_vert],
+        np.where(corner_smooth[:, None], vert_no[corner_vert],
+                 face_no[corner_face])
+    ]
+
+    if uv_layer:
+        face_uv = _foreach_get(uv_layer, "uv_raw", face_count, np.float32, 8)
+        attributes.append(face_uv.reshape(face_count, 4, 2)[corner_valid])
 
+    if color_layer:
+        face_color = np.stack(
+            [
+                _foreach_get(color_layer, "color%i" % (j + 1), face_count,
+                             np.float32, 3) for j in range(4)
+            ],
+            axis=1)
+        attributes.append(face_color[corner_valid])
+
+    # Weld smooth corners with identical data. Adding zero folds -0.0 into
+    # 0.0, so the byte wise comparison matches float equality.
+    smooth_corners = np.flatnonzero(corner_smooth)
+    keys = np.hstack(attributes)[smooth_corners] + np.float32(0)
+    keys = np.ascontiguousarray(keys).view(
+        np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    emit = ~corner_smooth
+    emit[smooth_corners[first]] = True
+
+    corner_index = np.cumsum(emit) - 1
+    corner_index[smooth_corners] = corner_index[smooth_corners[first]][
+        inverse.ravel()]
+
+    # Triangulate
+    face_data = np.zeros((face_count, 4), dtype=np.int64)
+    face_data[corner_valid] = corner_index
+
+    tris = np.stack((face_data[:, [0, 1, 2]], face_data[:, [0, 2, 3]]), axis=1)
+    tri_valid = np.stack((np.ones(face_count, dtype=bool), corner_valid[:, 3]),
+                         axis=1)
+
+    return TriMesh(
+        points=attributes[0][emit],
+        normals=attributes[1][emit],
+        uvs=attributes[2][emit] if uv_layer else None,
+        colors=attributes[-1][emit] if color_layer else None,
+        face_indices=tris[tri_valid],
+        material_indices=np.repeat(face_mat[:, None], 2, axis=1)[tri_valid])
+
+
+def _cluster_mean(inverse, count, values):
+    sums = np.stack([np.bincount(inverse, weights=values[:, i], minlength=len(count))
+                     for i in range(values.shape[1])], axis=1)
+    return (sums / count[:, None]).astype(np.float32)
+
+
+def decimate_trimesh(data, level):
+    # Vertex clustering on a grid with cells 2^level times the mean edge
+    # length, which leaves about a fourth of the triangles per level.
+    # Corners facing different main directions are never merged, so hard
+    # edges survive.
+    faces = data.face_indices
+    if level <= 0 or not len(faces):
+        return data
+
+    corners = data.points[faces]
+    edges = corners - np.roll(corners, 1, axis=1)
+    cell = np.sqrt((edges * edges).sum(axis=2)).mean() * (1 << level)
+    if cell <= 0:
+        return data
+
+    cells = np.floor((data.points - data.points.min(axis=0)) / cell).astype(np.int64)
+    axis = np.abs(data.normals).argmax(axis=1)
+    side = data.normals[np.arange(len(axis)), axis] < 0
+    dims = cells.max(axis=0) + 1
+    keys = ((cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]) * 6 + axis * 2 + side
+
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    count = np.bincount(inverse).astype(np.float64)
+
+    normals = _cluster_mean(inverse, count, data.normals)
+    length = np.sqrt((normals * normals).sum(axis=1))
+    normals = normals / np.maximum(length, 1e-12)[:, None]
+
+    # Triangles collapsed into a line or a point disappear
+    faces = inverse[faces]
+    valid = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    if not valid.any():
+        return data
+
+    used, faces = np.unique(faces[valid], return_inverse=True)
+    return TriMesh(
+        points=_cluster_mean(inverse, count, data.points)[used],
+        normals=normals[used].astype(np.float32),
+        uvs=_cluster_mean(inverse, count, data.uvs)[used] if data.uvs is not None else None,
+        colors=_cluster_mean(inverse, count, data.colors)[used] if data.colors is not None else None,
+        face_indices=faces.reshape(-1, 3),
+        material_indices=data.material_indices[valid])
+
+
+def box_trimesh(bound_box):
+    # Flat shaded box around the given corners, with the first material
+    corners = np.array([tuple(c) for c in bound_box], dtype=np.float32)
+    low = corners.min(axis=0)
+    points = low + BOX_BITS * (corners.max(axis=0) - low)
+
+    quads = np.arange(24).reshape(6, 4)
+    return TriMesh(
+        points=points[BOX_QUADS.ravel()],
+        normals=np.repeat(BOX_NORMALS, 4, axis=0),
+        uvs=None,
+        colors=None,
+        face_indices=np.concatenate((quads[:, [0, 1, 2]], quads[:, [0, 2, 3]])),
+        material_indices=np.zeros(12, dtype=np.int32))
+
+
+def triangle_count(obj):
+    # Triangles of the mesh data block, modifiers are not applied
+    if obj.type != 'MESH':
+        return 0
+
+    polygons = obj.data.polygons
+    loops = _foreach_get(polygons, "loop_total", len(polygons), np.int32)
+    return int(loops.sum()) - 2 * len(loops)
+
+
+def write_trimesh_inline(w, data):
     w.write("(attribute")
     w.goIn()
-    line = ":type 'p'"
-    for v in points:
-        line = line + ", [%f, %f, %f]" % v[:]
-    w.write(line)
+    w.write_list(":type 'p'", "[%f, %f, %f]", data.points)
+    w.goOut()
+    w.write(")")
 
+    w.write("(attribute")
+    w.goIn()
+    w.write_list(":type 'n'", "[%f, %f, %f]", data.normals)
     w.goOut()
     w.write(")")
 
+    if data.uvs is not None:
+        w.write("(attribute")
+        w.goIn()
+        w.write_list(":type 't'", "[%f, %f]", data.uvs)
+        w.goOut()
+        w.write(")")
+
+    if data.colors is not None:
+        w.write("(attribute")
+        w.goIn()
+        w.write(":type 'u'")
+        w.write_list(":name 'color'", "[%f, %f, %f, 1]", data.colors)
+        w.goOut()
+        w.write(")")
+
+    w.write("(materials")
+    w.goIn()
+    w.write_list("", "%i", data.material_indices, ",")
+    w.goOut()
+    w.write(")")
+
+    w.write("(faces")
+    w.goIn()
+    w.write_list("", "%i", data.face_indices.ravel(), ",")
+    w.goOut()
+    w.write(")")
+
+
+def inline_binary_buffer(w, sidecar, array, dtype, dtype_name):
+    path, offset = sidecar.write(array.astype(dtype, copy=False))
+
+    # Temporary sidecar names differ per export, the content is tracked by
+    # the mesh digest instead
+    w.write_volatile(":file '%s'" % path)
+    w.write(":offset %i" % offset)
+    w.write(":dtype '%s'" % dtype_name)
+    w.write(":count %i" % len(array))
+
+
+def write_trimesh_binary(w, data, sidecar):
+    # Little-endian buffers, count is the number of elements (not scalars)
     w.write("(attribute")
     w.goIn()
-    line = ":type 'n'"
-    for n in normals:
-        line = line + ", [%f, %f, %f]" % n[:]
-    w.write(line)
+    w.write(":type 'p'")
+    inline_binary_buffer(w, sidecar, data.points, '<f4', 'float32')
     w.goOut()
     w.write(")")
 
-    if uv_layer:
+    w.write("(attribute")
+    w.goIn()
+    w.write(":type 'n'")
+    inline_binary_buffer(w, sidecar, data.normals, '<f4', 'float32')
+    w.goOut()
+    w.write(")")
+
+    if data.uvs is not None:
         w.write("(attribute")
         w.goIn()
-        line = ":type 't'"
-        for uv in uvs:
-            line = line + ", [%f, %f]" % uv[:]
-        w.write(line)
+        w.write(":type 't'")
+        inline_binary_buffer(w, sidecar, data.uvs, '<f4', 'float32')
         w.goOut()
         w.write(")")
 
-    if color_layer:
+    if data.colors is not None:
+        colors = np.ones((len(data.colors), 4), dtype=np.float32)
+        colors[:, :3] = data.colors
+
         w.write("(attribute")
         w.goIn()
         w.write(":type 'u'")
-        line = ":name 'color'"
-        for c in colors:
-            line = line + ", [%f, %f, %f, 1]" % c[:]
-        w.write(line)
+        w.write(":name 'color'")
+        inline_binary_buffer(w, sidecar, colors, '<f4', 'float32')
         w.goOut()
         w.write(")")
 
     w.write("(materials")
     w.goIn()
-    w.write(",".join(map(str, material_indices)))
+    inline_binary_buffer(w, sidecar, data.material_indices, '<u4', 'uint32')
     w.goOut()
     w.write(")")
 
     w.write("(faces")
     w.goIn()
-    w.write(",".join(",".join(map(str, f)) for f in face_indices))
+    inline_binary_buffer(w, sidecar, data.face_indices, '<u4', 'uint32')
     w.goOut()
     w.write(")")
 
+
+def write_trimesh(exporter, w, data, sidecar=None):
+    w.write(":type 'triangles'")
+
+    if exporter.mesh_format == 'BINARY':
+        write_trimesh_binary(w, data, sidecar or exporter.mesh_sidecar())
+    else:
+        write_trimesh_inline(w, data)
+
+
+def format_trimesh_inline(data):
+    # Runs inside the export process pool, so no bpy access in here
+    block = Writer(io.StringIO())
+    block.write(":type 'triangles'")
+    write_trimesh_inline(block, data)
+    block.flush()
+
+    return block.file.getvalue()
+
+
+def write_mesh_block(w, name, block):
+    w.write("(mesh")
+    w.goIn()
+
+    w.write(":name '%s'" % name)
+    w.write_block(block)
+
     w.goOut()
     w.write(")")
 
-    del face_indices
-    del material_indices
-    del points
-    del normals
-    del uvs
-    del colors
 
-    return name
+def export_trimesh(exporter, mw, name, mesh, cache_key=None, level=0):
+    return export_trimesh_data(exporter, name, decimate_trimesh(extract_trimesh(mesh), level),
+                               cache_key)
 
 
-def export_mesh(exporter, obj):
+def export_trimesh_data(exporter, name, data, cache_key=None):
     w = exporter.w
 
-    try:
-        mesh = obj.to_mesh(
-            exporter.scene,
-            True,
-            'RENDER',
-            calc_tessface=True,
-            calc_undeformed=True)
-    except:
-        print("Couldn't export %s as mesh" % obj.name)
-        return
+    digest = mesh_digest(data)
+
+    n, in_cache = exporter.register_mesh_digest(name, digest)
+    if in_cache:
+        return n
 
+    if exporter.pool and exporter.mesh_format != 'BINARY':
+        def finish(block):
+            if cache_key:
+                exporter.geometry_cache.store(cache_key, digest, block)
+
+        w.write("(mesh")
+        w.goIn()
+
+        w.write(":name '%s'" % name)
+        w.write_fragment(exporter.pool.submit(format_trimesh_inline, data), finish)
+
+        w.goOut()
+        w.write(")")
+        return name
+
+    if cache_key:
+        # Serialize without the name, so the entry fits any later export
+        cache = exporter.geometry_cache
+        block = Writer(io.StringIO())
+
+        sidecar = None
+        if exporter.mesh_format == 'BINARY':
+            sidecar = cache.sidecar(cache_key)
+
+        write_trimesh(exporter, block, data, sidecar)
+        block.flush()
+
+        cache.store(cache_key, digest, block.file.getvalue(), sidecar)
+        write_mesh_block(w, name, block.file.getvalue())
+        return name
+
+    w.write("(mesh")
+    w.goIn()
+
+    w.write(":name '%s'" % name)
+    write_trimesh(exporter, w, data)
+
+    w.goOut()
+    w.write(")")
+
+    return name
+
+
+def export_cached_mesh(exporter, obj, level=0):
+    cache = exporter.geometry_cache
+    if not cache or obj.type != 'MESH':
+        return '', None
+
+    key = cache.geometry_key(obj, exporter.mesh_format, exporter.scene.frame_current)
+    if not key:
+        return '', None
+    if level:
+        key = "%s_lod%i" % (key, level)
+    entry = cache.load(key)
+    if not entry:
+        return '', key
+
+    digest, block = entry
     name = exporter.register_unique_name('MESH', obj.data.name)
-    name = export_trimesh(exporter, obj.matrix_world, name, mesh)
-    bpy.data.meshes.remove(mesh)
+    n, in_cache = exporter.register_mesh_digest(name, digest)
+    if in_cache:
+        return n, key
+
+    write_mesh_block(exporter.w, name, block)
+    return name, key
+
+
+def is_instanceable(obj):
+    # Without modifiers and shape keys the evaluated mesh is the datablock
+    # itself, so all objects sharing it can use the same geometry
+    return obj.type == 'MESH' and not obj.modifiers and not obj.data.shape_keys
+
+
+def export_mesh(exporter, obj):
+    profiler = exporter.profiler
+
+    level = exporter.lod_levels.get(obj.name, 0)
+
+    instance_key = None
+    if is_instanceable(obj):
+        instance_key = (obj.data.as_pointer(), level)
+
+    name = exporter.mesh_instances.get(instance_key, '')
+    cache_key = None
+    if not name:
+        with profiler.phase("cache", obj.name):
+            name, cache_key = export_cached_mesh(exporter, obj, level)
+    if not name:
+        try:
+            with profiler.phase("to_mesh", obj.name):
+                mesh = obj.to_mesh(
+                    exporter.scene,
+                    True,
+                    'RENDER',
+                    calc_tessface=True,
+                    calc_undeformed=True)
+        except:
+            print("Couldn't export %s as mesh" % obj.name)
+            return
+
+        name = exporter.register_unique_name('MESH', obj.data.name)
+        with profiler.phase("export_trimesh", obj.name):
+            name = export_trimesh(exporter, obj.matrix_world, name, mesh, cache_key, level)
+        bpy.data.meshes.remove(mesh)
+
+    if instance_key:
+        exporter.mesh_instances[instance_key] = name
+
+    write_mesh_entity(exporter, obj, name)
+
+
+def export_proxy(exporter, obj):
+    # The bounding box in place of the object mesh
+    name = exporter.register_unique_name('MESH', "%s_proxy" % obj.data.name)
+    name = export_trimesh_data(exporter, name, box_trimesh(obj.bound_box))
+    write_mesh_entity(exporter, obj, name)
+
+
+def write_mesh_entity(exporter, obj, name):
+    w = exporter.w
 
     w.write("(entity")
     w.goIn()
@@ -208,10 +481,10 @@ def export_mesh(exporter, obj):
     w.write(":type 'mesh'")
 
     if len(obj.data.materials) == 1:
-        w.write(":materials '%s'" % obj.data.materials[0].name)
+        w.write(":materials '%s'" % material_name(exporter, obj.data.materials[0]))
     elif len(obj.data.materials) > 1:
         w.write(":materials [%s]" % ', '.join(
-            ['"%s"' % m.name for m in obj.data.materials]))
+            ['"%s"' % material_name(exporter, m) for m in obj.data.materials]))
     else:
         w.write(":material '%s'" % exporter.MISSING_MAT)
         print("Mesh %s has no material!" % obj.name)
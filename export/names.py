@@ -0,0 +1,30 @@
+class NameRegistry:
+    def __init__(self):
+        self.names = set()
+        # Next suffix to try per base name, all suffixes below are taken
+        self.suffixes = {}
+
+
+    def __contains__(self, name):
+        return name in self.names
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def register(self, name):
+        if name not in self.names:
+            self.names.add(name)
+            return name
+
+        i = self.suffixes.get(name, 1)
+        test_name = "%s_%i" % (name, i)
+        while test_name in self.names:
+            i = i + 1
+            test_name = "%s_%i" % (name, i)
+
+        self.names.add(test_name)
+        self.suffixes[name] = i + 1
+
+        return test_name
@@ -0,0 +1,158 @@
+import sys
+import time
+import json
+import collections
+import contextlib
+
+try:
+    import resource
+except ImportError:# Not available on Windows
+    resource = None
+
+
+def peak_rss():
+    if not resource:
+        return 0
+
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def current_rss():
+    # Resident bytes right now, only known on Linux
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+    except (IOError, ValueError, IndexError):
+        return 0
+
+    return pages * resource.getpagesize() if resource else 0
+
+
+class PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.wall = 0
+        self.cpu = 0
+        self.bytes = 0
+        # How far a single run raised the process peak, zero if it stayed
+        # below an earlier one
+        self.peak_growth = 0
+        # Memory still held after all runs, negative if they freed some
+        self.rss_change = 0
+
+
+    def add(self, wall, cpu, bytes, peak_growth, rss_change):
+        self.count = self.count + 1
+        self.wall = self.wall + wall
+        self.cpu = self.cpu + cpu
+        self.bytes = self.bytes + bytes
+        self.peak_growth = max(self.peak_growth, peak_growth)
+        self.rss_change = self.rss_change + rss_change
+
+
+    def to_dict(self):
+        return {"count": self.count, "wall": self.wall, "cpu": self.cpu,
+                "bytes": self.bytes, "peak_growth": self.peak_growth,
+                "rss_change": self.rss_change}
+
+
+class NoPhase:
+    # Stands in for phases which are not recorded
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        return False
+
+
+NO_PHASE = NoPhase()
+
+
+class Profiler:
+    def __init__(self, counter=lambda: 0, detailed=False):
+        # counter returns the number of bytes written so far
+        self.counter = counter
+        # Per object phases and memory sampling cost more than most objects
+        # take to export, they are only recorded for reports
+        self.detailed = detailed
+
+        self.stack = []
+        self.phases = collections.OrderedDict()
+        self.objects = collections.OrderedDict()
+        self.notes = collections.OrderedDict()
+
+
+    def phase(self, name, obj=None):
+        # Nested phases are named by their path, e.g. export/meshes. With obj
+        # the time is accounted to that object instead.
+        if obj is not None and not self.detailed:
+            return NO_PHASE
+        return self._phase(name, obj)
+
+
+    @contextlib.contextmanager
+    def _phase(self, name, obj):
+        detailed = self.detailed
+        if obj is None:
+            self.stack.append(name)
+            name = "/".join(self.stack)
+
+        stats = self._stats(name, obj)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_bytes = self.counter()
+        start_peak = peak_rss() if detailed else 0
+        start_rss = current_rss() if detailed else 0
+        try:
+            yield
+        finally:
+            stats.add(time.perf_counter() - start_wall,
+                      time.process_time() - start_cpu,
+                      self.counter() - start_bytes,
+                      peak_rss() - start_peak if detailed else 0,
+                      current_rss() - start_rss if detailed else 0)
+            if obj is None:
+                self.stack.pop()
+
+
+    def _stats(self, name, obj):
+        phases = self.phases
+        if obj is not None:
+            phases = self.objects.setdefault(obj, collections.OrderedDict())
+
+        stats = phases.get(name)
+        if not stats:
+            stats = PhaseStats()
+            phases[name] = stats
+        return stats
+
+
+    def note(self, obj, name, value):
+        # Decisions made for an object, like its level of detail
+        self.notes.setdefault(obj, collections.OrderedDict())[name] = value
+
+
+    def summary(self):
+        # Top level phases only, short enough for the status bar
+        return ", ".join("%s %.2fs" % (name, stats.wall)
+                         for name, stats in self.phases.items() if "/" not in name)
+
+
+    def to_dict(self):
+        return {
+            "peak_rss": peak_rss(),
+            "phases": collections.OrderedDict(
+                (name, stats.to_dict()) for name, stats in self.phases.items()),
+            "objects": collections.OrderedDict(
+                (obj, collections.OrderedDict((name, stats.to_dict()) for name, stats in phases.items()))
+                for obj, phases in self.objects.items()),
+            "notes": self.notes
+        }
+
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1)
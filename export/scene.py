@@ -1,25 +1,111 @@
-import bpy
 from .camera import export_camera as export_camera
 from .light import export_light as export_light
 from .material import export_default_materials as export_default_materials
 from .material import export_material as export_material 
 from .mesh import export_mesh as export_mesh
+from .mesh import export_proxy, triangle_count, MAX_LOD_LEVEL
+from .texture import queue_material_textures, measure_images
 from .spectral import write_spectral_color
 from .settings import export_settings
+from .visibility import CameraView, object_corners
 
 
-def is_renderable(scene, ob):
-    return (not ob.hide_render)
+def render_layers(scene):
+    # Layers of the scene not excluded by the active render layer. Objects
+    # only on layers the render layer does not show still cast light and
+    # shadows, like in Blender Internal and Cycles.
+    rl = scene.render.layers.active
+    return [visible and not excluded
+            for visible, excluded in zip(scene.layers, rl.layers_exclude)]
+
+
+def is_renderable(scene, ob, layers):
+    return (not ob.hide_render) and any(l and o for l, o in zip(layers, ob.layers))
 
 
 def renderable_objects(scene):
-    return [ob for ob in bpy.data.objects if is_renderable(scene, ob)]
+    layers = render_layers(scene)
+    return [ob for ob in scene.objects if is_renderable(scene, ob, layers)]
 
 
 def is_allowed_mesh(ob):
     return (not ob.type in {'META', 'FONT', 'ARMATURE', 'LATTICE', 'EMPTY', 'CAMERA', 'LAMP', 'SPEAKER'})
 
 
+def classify_objects(objs):
+    # Lights and meshes, each object's type is only looked at once
+    lights = []
+    meshes = []
+    for ob in objs:
+        if ob.type == 'LAMP':
+            lights.append(ob)
+        elif is_allowed_mesh(ob):
+            meshes.append(ob)
+    return lights, meshes
+
+
+def casts_shadows(ob):
+    # Meshes without materials get the missing material, which does
+    return (not len(ob.data.materials) or
+            any(not m or m.pearray.cast_shadows for m in ob.data.materials))
+
+
+def cull_objects(exporter, meshes):
+    # Meshes to export fully and as bounding boxes. Meshes outside of the
+    # view are only kept within the margin and when casting shadows.
+    if not meshes:
+        return meshes, []
+
+    scene = exporter.scene
+    view = CameraView(scene, exporter.camera)
+    outside = view.outside_distance([object_corners(ob) for ob in meshes])
+
+    kept = []
+    proxies = []
+    saved = 0
+    for ob, distance in zip(meshes, outside):
+        shadows = casts_shadows(ob)
+        if distance <= 0 or (shadows and distance <= scene.pearray.culling_margin):
+            kept.append(ob)
+            continue
+
+        saved = saved + triangle_count(ob)
+        if shadows and scene.pearray.culling_mode == 'PROXY':
+            proxies.append(ob)
+            saved = saved - 12
+
+    print("Culled %i of %i meshes (%i as bounding boxes), %i triangles saved" %
+          (len(meshes) - len(kept), len(meshes), len(proxies), saved))
+    return kept, proxies
+
+
+def choose_lod_levels(exporter, meshes):
+    # The most decimated level still having lod_density triangles for every
+    # pixel of the area the mesh covers
+    if not meshes:
+        return
+
+    scene = exporter.scene
+    view = CameraView(scene, exporter.camera)
+    footprints = view.footprints([object_corners(ob) for ob in meshes])
+
+    decimated = 0
+    for ob, footprint in zip(meshes, footprints):
+        budget = scene.pearray.lod_density * footprint * footprint
+        triangles = triangle_count(ob)
+
+        level = 0
+        while level < MAX_LOD_LEVEL and triangles / 4 ** (level + 1) >= budget:
+            level = level + 1
+
+        exporter.lod_levels[ob.name] = level
+        exporter.profiler.note(ob.name, "lod", level)
+        if level:
+            decimated = decimated + 1
+
+    print("Decimated %i of %i meshes" % (decimated, len(meshes)))
+
+
 def write_scene(exporter, pr):
     w = exporter.w
     scene = exporter.scene
@@ -32,7 +118,7 @@ def write_scene(exporter, pr):
         w.write(":name '_from_blender'")
         w.write(":renderWidth %i" % res_x)
         w.write(":renderHeight %i" % res_y)
-        w.write(":camera '%s'" % scene.camera.name)
+        w.write(":camera '%s'" % exporter.camera.name)
 
 
     def export_outputs():
@@ -136,35 +222,60 @@ def write_scene(exporter, pr):
                 w.write(")")
 
     # Block
-    objs = renderable_objects(scene)
+    profiler = exporter.profiler
+    lights, meshes = classify_objects(renderable_objects(scene))
+    proxies = []
 
     w.write("(scene")
     w.goIn()
 
-    export_scene()
-    w.write("; Settings")
-    export_settings(exporter, pr,scene)
-    w.write("; Outputs")
-    export_outputs()
-    w.write("; Default Materials")
-    export_default_materials(exporter)
-    w.write("; Camera")
-    export_camera(exporter, scene.camera)
-    w.write("; Background")
-    export_background()
+    with profiler.phase("settings"):
+        export_scene()
+        w.write("; Settings")
+        export_settings(exporter, pr,scene)
+        w.write("; Outputs")
+        export_outputs()
+        w.write("; Default Materials")
+        export_default_materials(exporter)
+        w.write("; Camera")
+        export_camera(exporter, exporter.camera)
+        w.write("; Background")
+        export_background()
     w.write("; Lights")
-    for light in objs:
-        if light.type == 'LAMP':
-            export_light(exporter, light)
+    with profiler.phase("lights"):
+        for light in lights:
+            with profiler.phase("light", light.name):
+                export_light(exporter, light)
+    if exporter.use_culling and exporter.camera:
+        with profiler.phase("culling"):
+            meshes, proxies = cull_objects(exporter, meshes)
+    if exporter.use_lod and exporter.camera:
+        with profiler.phase("lod"):
+            choose_lod_levels(exporter, meshes)
+    # Image files are prepared on the texture pool while meshes are exported
+    with profiler.phase("textures"):
+        if exporter.texture_downscale and exporter.camera:
+            measure_images(exporter, meshes)
+        for obj in meshes:
+            for m in obj.data.materials:
+                queue_material_textures(exporter, m)
     w.write("; Meshes")
-    for obj in objs:
-        if is_allowed_mesh(obj):
+    with profiler.phase("meshes"):
+        for obj in meshes:
             export_mesh(exporter, obj)
+        for obj in proxies:
+            export_proxy(exporter, obj)
     w.write("; Materials")
-    for obj in objs:
-        if is_allowed_mesh(obj):
+    with profiler.phase("materials"):
+        for obj in meshes + proxies:
             for m in obj.data.materials:
-                export_material(exporter, m)
+                with profiler.phase("material", m.name):
+                    export_material(exporter, m)
+
+    if scene.pearray.merge_materials and exporter.material_names:
+        merged = len(set(exporter.material_names.values()))
+        print("Merged %i materials into %i (%.1f:1)" %
+              (len(exporter.material_names), merged, len(exporter.material_names) / merged))
 
     w.goOut()
     w.write(")")
\ No newline at end of file
@@ -1,35 +1,36 @@
-def write_spectral_color(exporter, spec_name, color):
+TEMPERATURE_TYPES = {
+    'LUM': 'temperature',
+    'RAD': 'temperature_raw',
+    'LUM_NORM': 'temperature_norm',
+    'RAD_NORM': 'temperature_raw_norm',
+}
+
+
+def write_spectrum(exporter, spec_name, data):
+    # Spectra are shared by their data, which the %f formatting quantizes
+    # to six decimals
+    if data in exporter.spectra:
+        return exporter.spectra[data]
+
     new_name = exporter.register_unique_name('SPEC', spec_name)
 
     exporter.w.write("(spectrum")
     exporter.w.goIn()
 
-    exporter.w.write(":name '%s'" % spec_name)
-    exporter.w.write(":data (rgb %f %f %f)" % color[:])
+    exporter.w.write(":name '%s'" % new_name)
+    exporter.w.write(":data %s" % data)
 
     exporter.w.goOut()
     exporter.w.write(")")
 
+    exporter.spectra[data] = new_name
     return new_name
 
 
-def write_spectral_temp(exporter, spec_name, temp, type, factor):
-    new_name = exporter.register_unique_name('SPEC', spec_name)
-
-    exporter.w.write("(spectrum")
-    exporter.w.goIn()
-
-    exporter.w.write(":name '%s'" % spec_name)
-    if type == 'LUM':
-        exporter.w.write(":data (temperature %f %f)" % (temp, factor))
-    elif type == 'RAD':
-        exporter.w.write(":data (temperature_raw %f %f)" % (temp, factor))
-    elif type == 'LUM_NORM':
-        exporter.w.write(":data (temperature_norm %f %f)" % (temp, factor))
-    elif type == 'RAD_NORM':
-        exporter.w.write(":data (temperature_raw_norm %f %f)" % (temp, factor))
+def write_spectral_color(exporter, spec_name, color):
+    return write_spectrum(exporter, spec_name, "(rgb %f %f %f)" % tuple(color[:]))
 
-    exporter.w.goOut()
-    exporter.w.write(")")
 
-    return new_name
\ No newline at end of file
+def write_spectral_temp(exporter, spec_name, temp, type, factor):
+    return write_spectrum(exporter, spec_name,
+                          "(%s %f %f)" % (TEMPERATURE_TYPES[type], temp, factor))
@@ -1,47 +1,248 @@
 import bpy
-import tempfile
+import os
+import hashlib
+import concurrent.futures
 
+from .cache import image_key, CACHE_VERSION
+from .visibility import CameraView, object_corners
 
-def export_image(exporter, image):
-    path = ''
-    if image.source in {'GENERATED', 'FILE'}:
-        if image.source == 'GENERATED':
-            path = exporter.create_file(name_hint=image.name)
+
+# Downscaled images never get smaller than this
+MIN_TEXTURE_SIZE = 64
+
+
+def save_image(exporter, image, key):
+    profiler = exporter.profiler
+    cache = exporter.texture_cache
+
+    if not cache or not key:
+        path = exporter.create_file(name_hint=image.name)
+        with profiler.phase("save_render", image.name):
             image.save_render(path, exporter.scene)
-        elif image.source == 'FILE':
-            if image.packed_file:
-                path = exporter.create_file(name_hint=image.name)
-                image.save_render(path, exporter.scene)
-            else:
-                path = image.filepath
+        return path
+
+    ext = exporter.scene.render.file_extension
+    path = cache.lookup(key, ext)
+    if path:
+        return path
+
+    with profiler.phase("save_render", image.name):
+        return cache.store(key, ext, lambda p: image.save_render(p, exporter.scene))
+
+
+def write_packed(path, data):
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def extract_packed(cache, path, data, settings, ext):
+    # Runs on the texture pool, the packed data already is an encoded file
+    source = hashlib.sha1(("%i;%s;" % (CACHE_VERSION, settings)).encode())
+    source.update(data)
+    key = source.hexdigest()
+
+    if cache:
+        path = cache.lookup(key, ext)
+        if not path:
+            path = cache.store(key, ext, lambda p: write_packed(p, data))
+    else:
+        write_packed(path, data)
+
+    return key, path
+
+
+def resolve_file(path, settings):
+    # Runs on the texture pool
+    source = "%s;%s" % (os.path.normcase(os.path.normpath(path)), settings)
+    return source, bpy.path.resolve_ncase(path)
+
+
+def image_slots(material):
+    if not material:
+        return []
+
+    return [slot for slot in material.texture_slots
+            if slot and slot.texture and slot.texture.type == 'IMAGE' and slot.texture.image]
+
+
+def measure_images(exporter, objs):
+    # Largest extent in pixels any object using an image covers on screen,
+    # scaled by how often the texture repeats
+    view = CameraView(exporter.scene, exporter.camera)
+    footprints = view.footprints([object_corners(obj) for obj in objs]) if objs else []
+
+    for obj, footprint in zip(objs, footprints):
+        for material in obj.data.materials:
+            for slot in image_slots(material):
+                name = slot.texture.image.name
+                repeat = max(abs(slot.scale[0]), abs(slot.scale[1]), 1)
+                exporter.image_footprints[name] = max(exporter.image_footprints.get(name, 0),
+                                                      float(footprint) * repeat)
+
+
+def mip_level(size, footprint, detail):
+    # Number of halvings still keeping detail texels per covered pixel
+    target = max(footprint * detail, MIN_TEXTURE_SIZE)
+    level = 0
+    while (size >> (level + 1)) >= target:
+        level = level + 1
+    return level
+
+
+def scaled_source(image, settings):
+    # Identifies the full resolution pixels of a file image
+    digest = hashlib.sha1(("%i;%s;" % (CACHE_VERSION, settings)).encode())
+    if image.packed_file:
+        digest.update(image.packed_file.data)
+    else:
+        path = bpy.path.abspath(image.filepath, library=image.library)
+        stat = os.stat(path)
+        digest.update(("%s;%i;%i" % (os.path.normcase(os.path.normpath(path)),
+                                     stat.st_mtime_ns, stat.st_size)).encode())
+    return digest.hexdigest()
+
+
+def save_scaled(image, path):
+    # Image.save writes the scaled buffer as is, without the view transform
+    # save_render would apply
+    image.filepath_raw = path
+    image.save()
+
+
+def downscale_image(exporter, image, settings, level):
+    # Scaling happens in Blender on the main thread, on a copy that is
+    # removed again. With mipmaps every level is cached at once.
+    cache = exporter.texture_cache
+    ext = os.path.splitext(image.filepath)[1]
+    source = scaled_source(image, settings)
+
+    levels = [level]
+    if cache and exporter.scene.pearray.texture_mipmaps:
+        levels = range(1, mip_level(max(image.size), 0, 1) + 1)
+
+    paths = {}
+    missing = []
+    for l in levels:
+        key = "%s_%i" % (source, l)
+        paths[l] = cache.lookup(key, ext) if cache else ''
+        if not paths[l]:
+            missing.append(l)
+
+    if missing:
+        width, height = image.size
+        copy = image.copy()
+        try:
+            copy.file_format = image.file_format
+            for l in missing:
+                copy.scale(max(1, width >> l), max(1, height >> l))
+                if cache:
+                    paths[l] = cache.store("%s_%i" % (source, l), ext,
+                                           lambda p: save_scaled(copy, p))
+                else:
+                    paths[l] = exporter.create_file(name_hint="%s_%i%s" % (image.name, l, ext))
+                    save_scaled(copy, paths[l])
+        finally:
+            bpy.data.images.remove(copy, do_unlink=True)
+
+    return "%s_%i" % (source, level), bpy.path.resolve_ncase(bpy.path.abspath(paths[level]))
+
+
+def queue_scaled(exporter, image, settings):
+    # A finished future with the downscaled image, None if the image is
+    # used at full resolution
+    footprint = exporter.image_footprints.get(image.name)
+    if footprint is None or image.source != 'FILE' or image.is_dirty:
+        return None
+
+    level = mip_level(max(image.size), footprint, exporter.scene.pearray.texture_detail)
+    if level == 0:
+        return None
+
+    future = concurrent.futures.Future()
+    with exporter.profiler.phase("downscale", image.name):
+        try:
+            future.set_result(downscale_image(exporter, image, settings, level))
+        except (OSError, RuntimeError) as e:
+            print("Could not downscale image %s: %s" % (image.name, e))
+            return None
+    return future
 
-    return bpy.path.resolve_ncase(bpy.path.abspath(path))
+
+def queue_image(exporter, image):
+    # Returns a future resolving to the image source, which identifies the
+    # decoded pixels, and the path handed to the engine. Everything touching
+    # bpy data happens here on the main thread.
+    future = exporter.image_jobs.get(image.name)
+    if future:
+        return future
+
+    settings = "%s;%s" % (image.colorspace_settings.name, image.alpha_mode)
+
+    scaled = queue_scaled(exporter, image, settings)
+    if scaled:
+        future = scaled
+    elif image.source == 'FILE' and not image.packed_file:
+        path = bpy.path.abspath(image.filepath, library=image.library)
+        future = exporter.texture_pool.submit(resolve_file, path, settings)
+    elif image.source == 'FILE' and not image.is_dirty:
+        path = ''
+        if not exporter.texture_cache:
+            path = exporter.create_file(name_hint=image.name)
+        ext = os.path.splitext(image.filepath)[1]
+        future = exporter.texture_pool.submit(extract_packed, exporter.texture_cache, path,
+                                              image.packed_file.data, settings, ext)
+    else:
+        # Generated and painted images have to be encoded by Blender itself
+        future = concurrent.futures.Future()
+        if image.is_dirty:
+            # Painted pixels are encoded every time, the file identifies them
+            path = bpy.path.resolve_ncase(bpy.path.abspath(save_image(exporter, image, None)))
+            future.set_result((path, path))
+        elif image.source == 'GENERATED' or image.packed_file:
+            with exporter.profiler.phase("texture_key", image.name):
+                key = image_key(image, exporter.scene)
+            path = save_image(exporter, image, key)
+            future.set_result((key, bpy.path.resolve_ncase(bpy.path.abspath(path))))
+        else:
+            future.set_result(('', ''))
+
+    exporter.image_jobs[image.name] = future
+    return future
+
+
+def queue_material_textures(exporter, material):
+    for slot in image_slots(material):
+        queue_image(exporter, slot.texture.image)
 
 
 def export_texture(exporter, texture):
     if not texture:
         return ''
-    
-    if texture.name in exporter.instances['TEXTURE']:
-        return ''
 
-    name = exporter.register_unique_name('TEXTURE', texture.name)
+    if texture.name in exporter.texture_names:
+        return exporter.texture_names[texture.name]
 
-    img_name = ''
-    if texture.type == 'IMAGE':
-        img_name = export_image(exporter, texture.image)
-    else:
+    if texture.type != 'IMAGE':
+        exporter.texture_names[texture.name] = ''
         return ''
-    
-    exporter.w.write("(texture")
-    exporter.w.goIn()
 
-    exporter.w.write(":name '%s'" % name)
-    exporter.w.write(":type 'color'")
-    exporter.w.write(":file '%s'" % img_name)
+    # Textures sharing an image are written once
+    source, img_name = queue_image(exporter, texture.image).result()
+    name = exporter.texture_sources.get(source)
+    if not name:
+        name = exporter.register_unique_name('TEXTURE', texture.name)
+
+        exporter.w.write("(texture")
+        exporter.w.goIn()
+
+        exporter.w.write(":name '%s'" % name)
+        exporter.w.write(":type 'color'")
+        exporter.w.write(":file '%s'" % img_name)
+
+        exporter.w.goOut()
+        exporter.w.write(")")
 
-    exporter.w.goOut()
-    exporter.w.write(")")
+        exporter.texture_sources[source] = name
 
+    exporter.texture_names[texture.name] = name
     return name
-    
\ No newline at end of file
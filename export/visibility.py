@@ -0,0 +1,106 @@
+import numpy as np
+
+
+from .camera import camera_plane
+
+
+def object_corners(obj):
+    # World space corners of the object bounds
+    corners = np.array([tuple(c) for c in obj.bound_box], dtype=np.float64)
+    matrix = np.array([tuple(row) for row in obj.matrix_world], dtype=np.float64)
+    return corners.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+
+class CameraView:
+    # Projects world space points into the pixels of the rendered frame
+    def __init__(self, scene, camera):
+        render = scene.render
+        self.width = render.resolution_x * render.resolution_percentage * 0.01
+        self.height = render.resolution_y * render.resolution_percentage * 0.01
+
+        matrix = np.array([tuple(row) for row in camera.matrix_world], dtype=np.float64)
+        self.world_to_camera = np.linalg.inv(matrix)
+
+        # The frame covers the same plane as the exported camera, shrunk by
+        # its zoom
+        data = camera.data
+        zoom = data.pearray.zoom
+        plane_width, plane_height = camera_plane(scene, camera)
+        self.half_x = plane_width * 0.5 / zoom
+        self.half_y = plane_height * 0.5 / zoom
+
+        # Pixels per unit, at distance one for perspective cameras
+        self.ortho = data.type == 'ORTHO'
+        self.scale = np.array([self.width * zoom / plane_width,
+                               self.height * zoom / plane_height])
+
+        self.near = max(getattr(data, "clip_start", 0.1), 1e-6)
+        self.far = getattr(data, "clip_end", np.inf)
+
+
+    def project(self, points):
+        # Pixel coordinates relative to the frame center and the depth in
+        # front of the camera, the camera looks down -Z
+        points = np.asarray(points, dtype=np.float64)
+        cam = points.dot(self.world_to_camera[:3, :3].T) + self.world_to_camera[:3, 3]
+        depth = -cam[..., 2]
+
+        if self.ortho:
+            return cam[..., :2] * self.scale, depth
+
+        return cam[..., :2] * self.scale / np.maximum(depth, self.near)[..., None], depth
+
+
+    def footprint(self, corners):
+        # Largest extent in pixels the box covers inside the frame. Boxes
+        # reaching behind the camera may cover all of it.
+        pixels, depth = self.project(corners)
+        if np.all(depth <= self.near):
+            return 0
+        if np.any(depth <= self.near):
+            return max(self.width, self.height)
+
+        half = np.array([self.width, self.height]) * 0.5
+        low = np.clip(pixels.min(axis=0), -half, half)
+        high = np.clip(pixels.max(axis=0), -half, half)
+        return float(np.max(high - low))
+
+
+    def footprints(self, corners):
+        # Vectorized footprint for many boxes, corners has the shape (n, 8, 3)
+        pixels, depth = self.project(corners)
+        half = np.array([self.width, self.height]) * 0.5
+        low = np.clip(pixels.min(axis=1), -half, half)
+        high = np.clip(pixels.max(axis=1), -half, half)
+        result = np.max(high - low, axis=1)
+
+        behind = depth <= self.near
+        result[np.any(behind, axis=1)] = max(self.width, self.height)
+        result[np.all(behind, axis=1)] = 0
+        return result
+
+
+    def outside_distance(self, corners):
+        # How far boxes lie outside of the view frustum, zero or less if they
+        # may be visible. A box is outside if all its corners are outside of
+        # one plane. corners has the shape (n, 8, 3).
+        corners = np.asarray(corners, dtype=np.float64)
+        cam = corners.dot(self.world_to_camera[:3, :3].T) + self.world_to_camera[:3, 3]
+        x = cam[..., 0]
+        y = cam[..., 1]
+        depth = -cam[..., 2]
+
+        half_x = self.half_x
+        half_y = self.half_y
+        if self.ortho:
+            planes = [x - half_x, -x - half_x, y - half_y, -y - half_y]
+        else:
+            # The side planes go through the camera, at half_x per unit depth
+            norm_x = np.sqrt(1 + half_x * half_x)
+            norm_y = np.sqrt(1 + half_y * half_y)
+            planes = [(x - half_x * depth) / norm_x, (-x - half_x * depth) / norm_x,
+                      (y - half_y * depth) / norm_y, (-y - half_y * depth) / norm_y]
+        planes.append(self.near - depth)
+        planes.append(depth - self.far)
+
+        return np.max([plane.min(axis=-1) for plane in planes], axis=0)
@@ -0,0 +1,184 @@
+import collections
+import numpy as np
+
+
+# Characters collected before they are handed to the file
+BUFFER_SIZE = 1 << 20
+# Rows formatted at once by write_list
+CHUNK_ROWS = 1 << 14
+
+
+class Writer:
+    def __init__(self, file, useTabs=True):
+        self.file = file
+        self.useTabs = useTabs
+        self.currentLevel = 0
+
+        self.prefixes = [""]
+        self.prefix = ""
+
+        self.buffer = []
+        self.buffered = 0
+
+        # Text waiting behind fragments which are not done yet
+        self.pending = collections.deque()
+        self.fragments = 0
+        self.max_fragments = 0
+
+        # Optional hash over everything except volatile lines
+        self.digest = None
+
+        # Characters written so far, fragments count once they are written
+        self.written = 0
+
+
+    def _append(self, str, volatile=False):
+        if self.digest and not volatile:
+            self.digest.update(str.encode())
+
+        self.buffer.append(str)
+        self.buffered = self.buffered + len(str)
+        self.written = self.written + len(str)
+        if self.buffered >= BUFFER_SIZE:
+            self._emit(False)
+
+
+    def _emit(self, wait):
+        text = "".join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+
+        if self.pending:
+            if text:
+                self.pending.append(text)
+            self._drain(wait)
+        elif text:
+            self.file.write(text)
+
+
+    def _drain(self, wait):
+        while self.pending:
+            item = self.pending[0]
+            if not wait and not isinstance(item, str) and not item[0].done():
+                break
+            self._write_pending()
+
+
+    def _write_pending(self):
+        item = self.pending.popleft()
+        if isinstance(item, str):
+            self.file.write(item)
+            return
+
+        future, prefix, finish = item
+        block = future.result()
+        if finish:
+            finish(block)
+        # Not part of the digest, when the block drains depends on the
+        # workers. Its mesh content was hashed in order by register_mesh_digest.
+        text = self._indent(block, prefix)
+        self.file.write(text)
+        self.written = self.written + len(text)
+        self.fragments = self.fragments - 1
+
+
+    def _indent(self, block, prefix):
+        if not self.useTabs:
+            return "".join(line.lstrip("\t") + "\n" for line in block.splitlines())
+        return "".join(prefix + line + "\n" for line in block.splitlines())
+
+
+    def write(self, str):
+        self._append(self.prefix + str + "\n")
+
+
+    def write_volatile(self, str):
+        # Lines which may change between frames without a full reload
+        self._append(self.prefix + str + "\n", True)
+
+
+    def write_list(self, head, fmt, values, sep=", "):
+        # Writes one line with head and every row of values formatted by fmt,
+        # joined by sep. Rows are formatted in chunks with a single % each.
+        item = sep + fmt
+
+        self._append(self.prefix + head)
+        if len(values):
+            values = values.reshape(len(values), -1)
+        for start in range(0, len(values), CHUNK_ROWS):
+            chunk = values[start:start + CHUNK_ROWS]
+            text = (item * len(chunk)) % tuple(chunk.ravel().tolist())
+            if start == 0 and not head:
+                text = text[len(sep):]
+            self._append(text)
+        self._append("\n")
+
+
+    def write_block(self, block):
+        # Blocks are stored with tabs relative to their own top level
+        self._append(self._indent(block, self.prefix))
+
+
+    def write_fragment(self, future, finish=None):
+        # The block a future resolves to is written at the current position.
+        # Output stays in order, text behind it waits until it is done.
+        self._emit(False)
+        while self.max_fragments and self.fragments >= self.max_fragments:
+            self._write_pending()
+
+        self.pending.append((future, self.prefix, finish))
+        self.fragments = self.fragments + 1
+
+
+    def flush(self):
+        self._emit(True)
+
+
+    def _update_prefix(self):
+        if not self.useTabs:
+            return
+
+        while len(self.prefixes) <= self.currentLevel:
+            self.prefixes.append(self.prefixes[-1] + "\t")
+        self.prefix = self.prefixes[max(0, self.currentLevel)]
+
+    
+    def goIn(self):
+        self.currentLevel = self.currentLevel + 1
+        self._update_prefix()
+    
+
+    def goOut(self):
+        self.currentLevel = self.currentLevel - 1
+        if self.currentLevel < 0:
+            print("DEV ERROR: PEARRAY Exporter currentLevel < 0!")
+        self._update_prefix()
+
+
+class Sidecar:
+    def __init__(self, path, file_path=None):
+        # The data may be written somewhere else first, path is the one
+        # referenced by the prc
+        self.path = path
+        self.file_path = file_path or path
+        self.file = open(self.file_path, 'wb')
+        self.written = 0
+
+
+    def write(self, array):
+        # Keep every buffer aligned, so the file can be memory-mapped
+        offset = self.file.tell()
+        padding = -offset % 16
+        if padding:
+            self.file.write(b'\0' * padding)
+            offset = offset + padding
+
+        data = np.ascontiguousarray(array).tobytes()
+        self.file.write(data)
+        self.written = offset + len(data)
+
+        return self.path, offset
+
+
+    def close(self):
+        self.file.close()
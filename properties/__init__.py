@@ -1,4 +1,5 @@
 import bpy
+import os
 
 from .camera import PearRayCameraProperties
 from .scene import PearRaySceneProperties
@@ -40,6 +41,32 @@ class PearRayPreferences(AddonPreferences):
                 min=0,
                 soft_max=10
                 )
+    viewport_fps = IntProperty(
+                name="Viewport FPS",
+                description="Maximum refresh rate of the rendered viewport",
+                default=10,
+                min=1,
+                soft_max=60
+                )
+    cache_dir = StringProperty(
+                name="Cache Directory",
+                description="Directory for cached export data. Can be empty to use the temporary directory",
+                subtype='DIR_PATH',
+                )
+    cache_size = IntProperty(
+                name="Cache Size (MB)",
+                description="Maximum size of each export cache. Least recently used entries are removed first. Zero disables the limit",
+                default=4096,
+                min=0,
+                soft_max=65536
+                )
+    cache_max_age = IntProperty(
+                name="Cache Max Age (Days)",
+                description="Remove cache entries not used for this many days. Zero keeps them",
+                default=30,
+                min=0,
+                soft_max=365
+                )
     verbose = BoolProperty(
                 name="Verbose",
                 description="Display verbose information in the produced log files",
@@ -52,6 +79,18 @@ class PearRayPreferences(AddonPreferences):
         col = layout.column(align=True)
         col.prop(self, "show_progress_interval")
         col.prop(self, "show_image_interval")
+        col.prop(self, "viewport_fps")
+        col = layout.column(align=True)
+        col.prop(self, "cache_dir")
+        col.prop(self, "cache_size")
+        col.prop(self, "cache_max_age")
+
+    def cache_path(self):
+        if self.cache_dir:
+            return bpy.path.resolve_ncase(bpy.path.abspath(self.cache_dir))
+        else:
+            import tempfile
+            return os.path.join(tempfile.gettempdir(), "pearray_cache")
 
 
 def register():
@@ -56,6 +56,18 @@ enum_tile_mode = (
     ("SPIRAL", "Spiral", "From the mid to border"),
 )
 
+enum_mesh_format = (
+    ("INLINE", "Inline", "Write mesh data as text into the prc file"),
+    ("BINARY", "Binary",
+     "Write mesh data into a binary sidecar file referenced by the prc"),
+)
+
+enum_culling_mode = (
+    ("SKIP", "Skip", "Leave culled objects out of the export"),
+    ("PROXY", "Bounding Box",
+     "Replace shadow casting culled objects with their bounding box"),
+)
+
 enum_photon_gathering_mode = (
     ("DOME", "Dome", "Gather only front side of surface"),
     ("SPHERE", "Sphere", "Gather around a point"),
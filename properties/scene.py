@@ -30,6 +30,87 @@ class PearRaySceneProperties(PropertyGroup):
         description="Keep generated prc file after rendering",
         default=False
     )
+    mesh_format = EnumProperty(
+        name="Mesh Format",
+        description="Storage format of exported mesh data",
+        items=enums.enum_mesh_format,
+        default='INLINE'
+        )
+    use_geometry_cache = BoolProperty(
+        name="Geometry Cache",
+        description="Reuse serialized meshes of unchanged objects from previous renders",
+        default=False
+    )
+    use_texture_cache = BoolProperty(
+        name="Texture Cache",
+        description="Reuse encoded packed and generated images from previous renders",
+        default=True
+    )
+    texture_downscale = BoolProperty(
+        name="Downscale Textures",
+        description="Hand image textures to the engine at the resolution their objects cover on screen",
+        default=False
+    )
+    texture_detail = FloatProperty(
+        name="Texture Detail",
+        description="Texels kept per covered pixel when downscaling textures",
+        min=0.1, soft_max=4, max=16,
+        default=1
+    )
+    texture_mipmaps = BoolProperty(
+        name="Cache Mipmaps",
+        description="Store every level down to the minimum size in the texture cache, so moving cameras reuse them",
+        default=False
+    )
+    merge_materials = BoolProperty(
+        name="Merge Identical Materials",
+        description="Export materials with the same settings and textures only once",
+        default=False
+    )
+    use_culling = BoolProperty(
+        name="Frustum Culling",
+        description="Leave out meshes outside of the camera view which can not affect it",
+        default=False
+    )
+    culling_margin = FloatProperty(
+        name="Culling Margin",
+        description="Distance outside of the camera view within which shadow casting meshes are kept for indirect light",
+        min=0, soft_max=100,
+        subtype="DISTANCE",
+        default=1
+    )
+    culling_mode = EnumProperty(
+        name="Culled Meshes",
+        description="What to do with meshes outside of the camera view and the margin",
+        items=enums.enum_culling_mode,
+        default='SKIP'
+        )
+    use_lod = BoolProperty(
+        name="Level of Detail",
+        description="Decimate meshes with more triangles than the pixels they cover in the camera view",
+        default=False
+    )
+    lod_density = FloatProperty(
+        name="LOD Density",
+        description="Triangles kept for every pixel a mesh covers",
+        min=0.01, soft_max=16,
+        default=1
+    )
+    use_export_pipeline = BoolProperty(
+        name="Parallel Mesh Export",
+        description="Serialize inline meshes in worker processes, one per render thread",
+        default=False
+    )
+    persistent_session = BoolProperty(
+        name="Persistent Session",
+        description="Keep the loaded scene alive between animation frames and only update changed transforms",
+        default=False
+    )
+    profile_report = BoolProperty(
+        name="Profiling Report",
+        description="Write time, memory and output size of every export and render phase as JSON next to the render output",
+        default=False
+    )
     linear_rgb = BoolProperty(
         name="Use linear sRGB",
         description="Return output in linear sRGB",
@@ -76,6 +76,9 @@ class RENDER_PT_pr_performance(RenderButtonsPanel, bpy.types.Panel):
         col.prop(rd, "tile_x", text="X")
         col.prop(rd, "tile_y", text="Y")
 
+        layout.prop(context.scene.pearray, "persistent_session")
+        layout.prop(context.scene.pearray, "profile_report")
+
 
 class RENDER_PT_pr_output(RenderButtonsPanel, bpy.types.Panel):
     bl_label = "Output"
@@ -168,5 +171,26 @@ class RENDER_PT_pr_export_settings(RenderButtonsPanel, bpy.types.Panel):
         
         layout.prop(scene.pearray, "keep_prc")
         layout.prop(scene.pearray, "beautiful_prc")
+        layout.prop(scene.pearray, "mesh_format")
+        layout.prop(scene.pearray, "use_geometry_cache")
+        layout.prop(scene.pearray, "use_texture_cache")
+        layout.prop(scene.pearray, "texture_downscale")
+        col = layout.column()
+        col.enabled = scene.pearray.texture_downscale
+        col.prop(scene.pearray, "texture_detail")
+        col.prop(scene.pearray, "texture_mipmaps")
+        layout.prop(scene.pearray, "merge_materials")
+        layout.prop(scene.pearray, "use_culling")
+        col = layout.column()
+        col.enabled = scene.pearray.use_culling
+        col.prop(scene.pearray, "culling_margin")
+        col.prop(scene.pearray, "culling_mode")
+        layout.prop(scene.pearray, "use_lod")
+        row = layout.row()
+        row.enabled = scene.pearray.use_lod
+        row.prop(scene.pearray, "lod_density")
+        row = layout.row()
+        row.enabled = scene.pearray.mesh_format == 'INLINE'
+        row.prop(scene.pearray, "use_export_pipeline")
         layout.prop(scene.pearray, "linear_rgb")
     